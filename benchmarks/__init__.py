@@ -0,0 +1,10 @@
+"""Offline micro benchmarks for the hot paths of kantek.
+
+Run them from the repository root with `python -m benchmarks`. Telegram and
+the database are replaced by the stand-ins in `benchmarks.fakes`, so no network
+access or database is needed, only the packages from requirements.txt.
+
+Every benchmark reports operations per second and the memory allocated per
+operation. The results are written to `benchmarks/results/<kantek version>.json`
+and compared with the results of the previous version.
+"""
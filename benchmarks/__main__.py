@@ -0,0 +1,51 @@
+"""Run the benchmark suite: python -m benchmarks [-k filter] [--baseline VERSION]"""
+import argparse
+import fnmatch
+import importlib
+import logging
+import os
+import sys
+import tempfile
+
+from benchmarks import harness
+
+MODULES = ['bench_parsers', 'bench_polizei', 'bench_pluginmgr', 'bench_helpers']
+
+
+def main() -> None:
+    """Run the selected benchmarks, print and store the results."""
+    parser = argparse.ArgumentParser(prog='python -m benchmarks', description=__doc__)
+    parser.add_argument('-k', '--filter', default='*',
+                        help='only run benchmarks matching this glob pattern')
+    parser.add_argument('--baseline', help='version to compare with, defaults to the latest')
+    parser.add_argument('--min-time', type=float, default=0.2,
+                        help='seconds each repeat should at least take')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--no-save', action='store_true', help="don't write the result file")
+    args = parser.parse_args()
+
+    harness.setup_path()
+    # plugins use paths relative to the kantek folder like when running bot.py
+    os.chdir(harness.KANTEK_DIR)
+    import logzero  # pylint: disable = C0415
+    logzero.loglevel(logging.WARNING)
+    for module in MODULES:
+        importlib.import_module(f'benchmarks.{module}')
+
+    version = harness.kantek_version()
+    baseline = harness.load_baseline(args.baseline, version)
+    results = []
+    with tempfile.TemporaryDirectory(prefix='kantek-bench-') as tmpdir:
+        for name, factory in harness.BENCHMARKS.items():
+            if not fnmatch.fnmatch(name, args.filter):
+                continue
+            result = harness.measure(name, factory(tmpdir), args.min_time, args.repeat)
+            results.append(result)
+            print(harness.format_result(result, baseline))
+            sys.stdout.flush()
+    if results and not args.no_save:
+        print(f'Saved results to {harness.save_results(results, version)}')
+
+
+if __name__ == '__main__':
+    main()
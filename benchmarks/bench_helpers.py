@@ -0,0 +1,42 @@
+"""Benchmarks of the banlist import helpers."""
+import os
+import random
+from typing import Callable
+
+from benchmarks.harness import benchmark
+from utils import helpers
+
+CSV_ROWS = 100000
+
+
+def _write_rose_csv(tmpdir: str) -> str:
+    path = os.path.join(tmpdir, 'rose_fbans.csv')
+    if not os.path.exists(path):
+        rng = random.Random(0)
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('id,firstname,lastname,username,reason\n')
+            for _ in range(CSV_ROWS):
+                uid = rng.randrange(10 ** 8, 10 ** 9)
+                f.write(f'{uid},Spam,Bot,,spam[kv2 0x1 0x{rng.randrange(999):04}]\n')
+    return path
+
+
+@benchmark('helpers.iter_rose_csv')
+def iter_rose_csv(tmpdir: str) -> Callable:
+    """Stream a fedban export with 100k rows."""
+    path = _write_rose_csv(tmpdir)
+
+    def op() -> None:
+        for _ in helpers.iter_rose_csv(path):
+            pass
+    return op
+
+
+@benchmark('helpers.rose_csv_to_dict')
+def rose_csv_to_dict(tmpdir: str) -> Callable:
+    """Load a fedban export with 100k rows into a list."""
+    path = _write_rose_csv(tmpdir)
+
+    async def op() -> None:
+        await helpers.rose_csv_to_dict(path)
+    return op
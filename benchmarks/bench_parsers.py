@@ -0,0 +1,28 @@
+"""Benchmarks of argument parsing and message formatting."""
+from typing import Callable
+
+from benchmarks.harness import benchmark
+from utils import parsers
+from utils.mdtex import Bold, Code, Italic, KeyValueItem, MDTeXDocument, Section, SubSection
+
+
+@benchmark('parsers.parse_arguments')
+def parse_arguments(tmpdir: str) -> Callable:
+    """Parse a command with keyword, quoted and positional arguments."""
+    arguments = 'count: true workers: 10 network: "spam fighters" reason: [a, b] @user 12345'
+    return lambda: parsers.parse_arguments(arguments)
+
+
+@benchmark('mdtex.render')
+def render_document(tmpdir: str) -> Callable:
+    """Render a response the size of the .stats output."""
+    def op() -> str:
+        return str(MDTeXDocument(
+            Section(Bold('Stats for kantek'),
+                    SubSection(KeyValueItem(Bold('Private Chats'), 120),
+                               KeyValueItem(Bold('Users'), 100),
+                               KeyValueItem(Bold('Bots'), 20)),
+                    *[KeyValueItem(Bold(f'Key {i}'), Code(i * 1000)) for i in range(12)],
+                    SubSection(*[KeyValueItem(Bold('Admin'), i) for i in range(6)])),
+            Italic('Took 0.12s')))
+    return op
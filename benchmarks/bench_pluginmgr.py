@@ -0,0 +1,33 @@
+"""Benchmarks of loading all plugins."""
+import os
+from typing import Callable
+
+from benchmarks.fakes import FakeClient
+from benchmarks.harness import benchmark
+from utils.pluginmgr import PluginManager
+
+
+def _register_all_op(tmpdir: str, use_manifest: bool) -> Callable:
+    manifest_path = os.path.join(tmpdir, 'plugin_manifest.json')
+
+    def op() -> None:
+        manager = PluginManager(FakeClient())
+        manager.active_plugins = []
+        manager.manifest_path = manifest_path
+        manager._manifest = manager._load_manifest()  # pylint: disable = W0212
+        if not use_manifest:
+            manager._manifest = {}  # pylint: disable = W0212
+        manager.register_all()
+    return op
+
+
+@benchmark('pluginmgr.register_all.cold')
+def register_all_cold(tmpdir: str) -> Callable:
+    """Parse, import and register every plugin."""
+    return _register_all_op(tmpdir, use_manifest=False)
+
+
+@benchmark('pluginmgr.register_all.manifest')
+def register_all_manifest(tmpdir: str) -> Callable:
+    """Import and register every plugin with the metadata from the manifest."""
+    return _register_all_op(tmpdir, use_manifest=True)
@@ -0,0 +1,104 @@
+"""Benchmarks of the blacklist checks polizei runs for every message."""
+import importlib.util
+import os
+import random
+import string
+from typing import Callable
+
+from benchmarks.fakes import FakeClient, FakeEvent, FakeMessage, MemoryBackend
+from benchmarks.harness import KANTEK_DIR, benchmark
+from utils import helpers
+
+BLACKLISTED_STRINGS = 1000
+BLACKLISTED_DOMAINS = 500
+BANNED_IDS = 100000
+
+CLEAN_TEXT = ('hey everyone, does anyone know when the next meetup is? '
+              'I put the notes on https://example.org/notes and the slides on the wiki')
+SPAM_TEXT = 'earn 500$ a day from home, contact me now! cryptoprofitbot'
+
+
+def _load_polizei():
+    path = os.path.join(KANTEK_DIR, 'plugins', 'autobahn', 'polizei.py')
+    spec = importlib.util.spec_from_file_location('polizei', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def _random_word(rng: random.Random, length: int) -> str:
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(length))
+
+
+def _filled_db() -> MemoryBackend:
+    rng = random.Random(0)
+    db = MemoryBackend()
+    strings = [_random_word(rng, rng.randint(6, 14)) for _ in range(BLACKLISTED_STRINGS - 1)]
+    db.ab_string_blacklist.add_strings(strings + ['cryptoprofitbot'])
+    domains = [f'{_random_word(rng, 8)}.com' for _ in range(BLACKLISTED_DOMAINS)]
+    db.ab_domain_blacklist.add_strings(domains + ['evil.com'])
+    db.banlist.index.load(rng.randrange(10 ** 8, 10 ** 9) for _ in range(BANNED_IDS))
+    return db
+
+
+def _check_message_op(text_urls: dict, text: str, cached: bool) -> Callable:
+    polizei = _load_polizei()
+    db = _filled_db()
+    for url, domain in text_urls.items():
+        helpers.URL_RESOLVER.cache.set(url if url.startswith('http') else f'http://{url}',
+                                       domain)
+    labels = {f'link{i}': url for i, url in enumerate(text_urls)}
+    message = FakeMessage.with_urls(text + ' ' + ' '.join(labels), labels)
+    event = FakeEvent(FakeClient(db), message)
+
+    async def op() -> None:
+        if not cached:
+            polizei.MESSAGE_VERDICTS.clear()
+        await polizei._check_message(event)  # pylint: disable = W0212
+    return op
+
+
+@benchmark('polizei.check_message.clean')
+def check_clean_message(tmpdir: str) -> Callable:
+    """A normal message with a link that is checked for the first time."""
+    return _check_message_op({'https://bit.ly/notes': 'example.org'}, CLEAN_TEXT, cached=False)
+
+
+@benchmark('polizei.check_message.spam')
+def check_spam_message(tmpdir: str) -> Callable:
+    """A message with a blacklisted string that is checked for the first time."""
+    return _check_message_op({}, SPAM_TEXT, cached=False)
+
+
+@benchmark('polizei.check_message.subdomain')
+def check_subdomain_message(tmpdir: str) -> Callable:
+    """A message linking to a subdomain of a blacklisted domain."""
+    return _check_message_op({'https://bit.ly/win': 'free.prizes.evil.com'}, CLEAN_TEXT,
+                             cached=False)
+
+
+@benchmark('polizei.check_message.cached')
+def check_cached_message(tmpdir: str) -> Callable:
+    """A copy of a message that was already checked."""
+    return _check_message_op({'https://bit.ly/notes': 'example.org'}, CLEAN_TEXT, cached=True)
+
+
+@benchmark('blacklist.string.match')
+def string_blacklist_match(tmpdir: str) -> Callable:
+    """Search a message for all blacklisted strings."""
+    blacklist = _filled_db().ab_string_blacklist
+    return lambda: blacklist.match(CLEAN_TEXT)
+
+
+@benchmark('blacklist.domain.match')
+def domain_blacklist_match(tmpdir: str) -> Callable:
+    """Look up a host and its parent domains."""
+    blacklist = _filled_db().ab_domain_blacklist
+    return lambda: blacklist.match('cdn.static.example.org')
+
+
+@benchmark('banlist.index.contains')
+def banlist_contains(tmpdir: str) -> Callable:
+    """Check if a user id is banned."""
+    index = _filled_db().banlist.index
+    return lambda: 123456789 in index
@@ -0,0 +1,158 @@
+"""Stand-ins for Telegram and the database so plugins can be benchmarked offline."""
+import re
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from telethon.tl.types import MessageEntityTextUrl, MessageEntityUrl
+
+from database.backend import BanListStore, BlacklistStore, StorageBackend
+from utils.ahocorasick import AhoCorasick
+from utils.domaintrie import DomainTrie
+
+
+class FakeMessage:
+    """The parts of a telethon Message the plugins use."""
+
+    def __init__(self, text: str, from_id: int = 900000000, out: bool = False,
+                 entities: Optional[List[Any]] = None) -> None:
+        self.message = text
+        self.raw_text = text
+        self.text = text
+        self.from_id = from_id
+        self.out = out
+        self.entities = entities
+
+    def get_entities_text(self) -> List[Tuple[Any, str]]:
+        """Return the entities with the text they cover."""
+        return [(entity, self.raw_text[entity.offset:entity.offset + entity.length])
+                for entity in self.entities or []]
+
+    @classmethod
+    def with_urls(cls, text: str, text_urls: Dict[str, str], **kwargs: Any) -> 'FakeMessage':
+        """Create a message with url entities for plain urls and text urls.
+
+        Args:
+            text: The message text, plain urls in it get a MessageEntityUrl
+            text_urls: Text in the message that links to a url
+
+        Returns: The message
+
+        """
+        entities: List[Any] = []
+        for word in text.split():
+            if word.startswith(('http://', 'https://', 't.me/')):
+                entities.append(MessageEntityUrl(text.index(word), len(word)))
+        for label, url in text_urls.items():
+            entities.append(MessageEntityTextUrl(text.index(label), len(label), url))
+        return cls(text, entities=entities, **kwargs)
+
+
+class FakeEvent:
+    """A NewMessage event that is not bound to a real client."""
+
+    def __init__(self, client: 'FakeClient', message: FakeMessage, chat_id: int = -1001) -> None:
+        self.client = client
+        self.message = message
+        self.chat_id = chat_id
+        self.out = message.out
+        self.raw_text = message.raw_text
+
+
+class FakeClient:
+    """A client that records event handlers and answers the plugin helpers from memory."""
+
+    def __init__(self, db: Optional['MemoryBackend'] = None,
+                 admins: Optional[Dict[int, frozenset]] = None) -> None:
+        self.db = db
+        self.admins = admins or {}
+        self.handlers: List[Tuple[Callable, Any]] = []
+
+    def add_event_handler(self, callback: Callable, event: Any = None) -> None:
+        """Record the handler instead of registering it with telegram."""
+        self.handlers.append((callback, event))
+
+    def remove_event_handler(self, callback: Callable, event: Any = None) -> int:
+        """Remove recorded handlers and return how many were removed."""
+        before = len(self.handlers)
+        self.handlers = [(cb, ev) for cb, ev in self.handlers if cb != callback]
+        return before - len(self.handlers)
+
+    async def is_admin(self, chat_id: int, user_id: int) -> bool:
+        """Check the admins that were passed to the constructor."""
+        return user_id in self.admins.get(chat_id, frozenset())
+
+
+class MemoryBlacklist(BlacklistStore):
+    """Blacklist engine that stores the strings in a dict."""
+    # nothing else can change the strings
+    sync_interval = float('inf')
+
+    def __init__(self, hex_type: str, index_class: Optional[type] = None) -> None:
+        self.hex_type = hex_type
+        self.index_class = index_class
+        self._rows: Dict[str, str] = {}
+        self._next_key = 1
+        self._changes = 0
+        self.sync()
+
+    def _insert_strings(self, strings: List[str]) -> Dict[str, str]:
+        added = {}
+        for string in strings:
+            if string not in self._rows:
+                added[string] = self._rows[string] = str(self._next_key)
+                self._next_key += 1
+        self._changes += bool(added)
+        return added
+
+    def _delete_strings(self, strings: List[str]) -> List[str]:
+        deleted = [string for string in strings if self._rows.pop(string, None) is not None]
+        self._changes += bool(deleted)
+        return deleted
+
+    def _load_strings(self) -> Dict[str, str]:
+        return dict(self._rows)
+
+    def _get_revision(self) -> str:
+        return str(self._changes)
+
+
+class MemoryBanList(BanListStore):
+    """Ban list engine that stores the bans in a dict."""
+
+    def __init__(self) -> None:
+        self._bans: Dict[str, str] = {}
+
+    def upsert_bans(self, bans: List[Dict[str, str]]) -> None:
+        for ban in bans:
+            self._bans[str(ban['id'])] = ban['reason']
+
+    def remove_bans(self, uids: List[str]) -> None:
+        for uid in uids:
+            self._bans.pop(str(uid), None)
+
+    def get_bans(self, uids: List[str]) -> List[Dict[str, str]]:
+        return [{'id': str(uid), 'reason': self._bans[str(uid)]}
+                for uid in uids if str(uid) in self._bans]
+
+    def count_bans(self, reason: str) -> int:
+        pattern = re.compile(re.escape(reason).replace('%', '.*').replace('_', '.'), re.S)
+        return sum(1 for ban_reason in self._bans.values() if pattern.fullmatch(ban_reason))
+
+    def _load_ids(self) -> Iterable[str]:
+        return iter(self._bans)
+
+
+class MemoryBackend(StorageBackend):
+    """Storage backend that keeps everything in memory.
+
+    The shared caches and the real AsyncBackend facade are used on top of it, so
+    the code paths that are answered from memory are the same as in production.
+    """
+
+    def __init__(self) -> None:
+        self.ab_bio_blacklist = MemoryBlacklist('0x0', AhoCorasick)
+        self.ab_string_blacklist = MemoryBlacklist('0x1', AhoCorasick)
+        self.ab_filename_blacklist = MemoryBlacklist('0x2')
+        self.ab_channel_blacklist = MemoryBlacklist('0x3')
+        self.ab_domain_blacklist = MemoryBlacklist('0x4', DomainTrie)
+        self.banlist = MemoryBanList()
+        self._setup()
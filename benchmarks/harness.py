@@ -0,0 +1,200 @@
+"""Registry, timing loop and result files of the benchmark suite."""
+import asyncio
+import configparser
+import importlib.util
+import json
+import os
+import platform
+import sys
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from typing import Any, Callable, Dict, List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+KANTEK_DIR = os.path.join(ROOT, 'kantek')
+RESULTS_DIR = os.path.join(ROOT, 'benchmarks', 'results')
+
+# name -> factory that does the setup and returns the operation to measure
+BENCHMARKS: Dict[str, Callable[[str], Callable]] = {}
+
+
+@dataclass
+class Result:
+    """The measurements of a single benchmark.
+
+    Attributes:
+        name: Name of the benchmark
+        ops_per_sec: Operations per second of the fastest repeat
+        mean_us: Microseconds per operation of the fastest repeat
+        peak_bytes: Highest memory allocated while running a single operation
+        retained_bytes: Memory per operation that was still allocated afterwards
+    """
+    name: str
+    ops_per_sec: float
+    mean_us: float
+    peak_bytes: int
+    retained_bytes: float
+
+
+def benchmark(name: str) -> Callable:
+    """Register a benchmark factory.
+
+    The factory gets a temporary directory, does all the setup and returns a
+    function or coroutine function that runs one operation.
+
+    Args:
+        name: Name of the benchmark, usually component.operation
+
+    Returns: The decorator
+
+    """
+    def decorator(factory: Callable[[str], Callable]) -> Callable[[str], Callable]:
+        BENCHMARKS[name] = factory
+        return factory
+    return decorator
+
+
+def setup_path() -> None:
+    """Make the kantek modules importable the same way bot.py imports them.
+
+    If there is no config.py the example config is used.
+    """
+    if KANTEK_DIR not in sys.path:
+        sys.path.insert(0, KANTEK_DIR)
+    if importlib.util.find_spec('config') is None:
+        spec = importlib.util.spec_from_file_location(
+            'config', os.path.join(KANTEK_DIR, 'example.config.py'))
+        config = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(config)
+        sys.modules['config'] = config
+
+
+def kantek_version() -> str:
+    """Return the current version from the bumpversion config."""
+    parser = configparser.ConfigParser()
+    parser.read(os.path.join(ROOT, '.bumpversion.cfg'))
+    return parser.get('bumpversion', 'current_version', fallback='unknown')
+
+
+def measure(name: str, op: Callable, min_time: float = 0.2, repeat: int = 5) -> Result:
+    """Run an operation until `min_time` passed, `repeat` times.
+
+    Args:
+        name: Name of the benchmark
+        op: The operation, a function or coroutine function without arguments
+        min_time: Seconds a single repeat should at least take
+        repeat: Amount of repeats, the fastest one is reported
+
+    Returns: The measurements
+
+    """
+    loop = asyncio.get_event_loop()
+    if asyncio.iscoroutinefunction(op):
+        async def _run_async(number: int) -> None:
+            for _ in range(number):
+                await op()
+
+        def run(number: int) -> None:
+            loop.run_until_complete(_run_async(number))
+    else:
+        def run(number: int) -> None:
+            for _ in range(number):
+                op()
+
+    # warm up caches and find a number of operations that takes long enough
+    number = 1
+    while True:
+        start = time.perf_counter()
+        run(number)
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            break
+        number = max(number * 2, int(number * min_time / elapsed) if elapsed else number * 10)
+
+    best = elapsed / number
+    for _ in range(repeat - 1):
+        start = time.perf_counter()
+        run(number)
+        best = min(best, (time.perf_counter() - start) / number)
+
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        run(1)
+        after_one, peak = tracemalloc.get_traced_memory()
+        run(number)
+        after, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return Result(name=name,
+                  ops_per_sec=1 / best,
+                  mean_us=best * 1e6,
+                  peak_bytes=max(peak - before, 0),
+                  retained_bytes=(after - after_one) / number)
+
+
+def save_results(results: List[Result], version: str, directory: str = RESULTS_DIR) -> str:
+    """Write the results of a run to `<version>.json`, merged with earlier runs.
+
+    Args:
+        results: The measurements
+        version: The kantek version
+        directory: The folder the files are kept in
+
+    Returns: The path of the file
+
+    """
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, f'{version}.json')
+    # keep the results of benchmarks that were filtered out of this run
+    stored = load_baseline(version, version, directory) or {}
+    data = {'version': version,
+            'python': platform.python_version(),
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'results': {**stored.get('results', {}),
+                        **{result.name: asdict(result) for result in results}}}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    return path
+
+
+def load_baseline(version: Optional[str], current: str,
+                  directory: str = RESULTS_DIR) -> Optional[Dict[str, Any]]:
+    """Load the results to compare against.
+
+    Args:
+        version: The version to load, None for the most recent file of another version
+        current: The version that is benchmarked right now
+        directory: The folder the files are kept in
+
+    Returns: The stored data or None if there is nothing to compare with
+
+    """
+    if version is None:
+        try:
+            files = [os.path.join(directory, name) for name in os.listdir(directory)
+                     if name.endswith('.json') and name != f'{current}.json']
+        except OSError:
+            return None
+        if not files:
+            return None
+        path = max(files, key=os.path.getmtime)
+    else:
+        path = os.path.join(directory, f'{version}.json')
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def format_result(result: Result, baseline: Optional[Dict[str, Any]]) -> str:
+    """Format a result as a table row, with the change to the baseline if there is one."""
+    row = (f'{result.name:<40} {result.ops_per_sec:>14,.0f} ops/s {result.mean_us:>12.2f}us '
+           f'{result.peak_bytes:>10,}B peak {result.retained_bytes:>10,.0f}B retained')
+    old = (baseline or {}).get('results', {}).get(result.name)
+    if old:
+        change = (result.ops_per_sec / old['ops_per_sec'] - 1) * 100
+        row += f'  {change:+.1f}% vs {baseline["version"]}'
+    return row
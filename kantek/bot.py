@@ -5,7 +5,9 @@ import os
 import logzero
 
 import config
-from database.arango import ArangoDB
+from database.backend import create_backend
+from utils import helpers, perf
+from utils.accountstats import AccountStats
 from utils.client import KantekClient
 from utils.loghandler import TGChannelLogHandler
 from utils.pluginmgr import PluginManager
@@ -30,12 +32,20 @@ def main() -> None:
     client.start(config.phone)
     client.kantek_version = __version__
     client.plugin_mgr = PluginManager(client)
+    client.account_stats = AccountStats(f'{os.path.abspath(config.session_name)}.stats.json')
+    client.account_stats.load()
     logger.info('Connecting to Database')
-    client.db = ArangoDB()
+    client.db = create_backend()
+    client.db.banlist.load_index()
+    logger.info('Loaded %s banned ids', len(client.db.banlist.index))
     client.plugin_mgr.register_all()
+    client.loop.create_task(client.plugin_mgr.watch())
+    metrics_file = getattr(config, 'metrics_file', 'tmp/kantek.prom')
+    client.loop.create_task(perf.REGISTRY.export_periodically(metrics_file))
     tlog.info('Started kantek v%s', __version__)
     logger.info('Started kantek v%s', __version__)
     client.run_until_disconnected()
+    client.loop.run_until_complete(helpers.URL_RESOLVER.close())
 
 
 if __name__ == '__main__':
@@ -1,6 +1,9 @@
 """Module containing all operations related to ArangoDB"""
-from typing import Dict, Optional, Any, List
+import json
+import logging
+from typing import Any, Dict, Iterable, List, Optional
 
+import logzero
 from pyArango.collection import Collection, Field
 from pyArango.connection import Connection
 from pyArango.database import Database
@@ -10,9 +13,18 @@ from pyArango.theExceptions import CreationError, DocumentNotFoundError
 from pyArango.validation import Int, NotNull
 
 import config
+from database.backend import (BanListStore, BlacklistStore, ChatSettings, ChatStore,
+                              IndexInfo, StorageBackend)
+from utils.ahocorasick import AhoCorasick
+from utils.domaintrie import DomainTrie
 
+logger: logging.Logger = logzero.logger
 
-class Chats(Collection):
+# ArangoDB error number when a unique index can't be created because of duplicates
+UNIQUE_CONSTRAINT_VIOLATED = 1210
+
+
+class Chats(ChatStore, Collection):
     """A Collection containing Telegram Chats"""
     _fields = {
         'id': Field([NotNull(), Int()]),
@@ -65,8 +77,32 @@ class Chats(Collection):
         except DocumentNotFoundError:
             return self.add_chat(chat_id)
 
+    def get_tagged_chats(self, tag: str) -> List[int]:
+        """Return the ids of all chats that have a tag or named tag.
+
+        Args:
+            tag: The tag
+
+        Returns: A list of chat ids
+
+        """
+        return list(self.database.AQLQuery('FOR doc IN Chats '
+                                           'FILTER @tag IN doc.tags OR HAS(doc.named_tags, @tag) '
+                                           'RETURN doc.id',
+                                           rawResults=True, batchSize=1000,
+                                           bindVars={'tag': tag}))
+
+    def _load_settings(self, chat_id: int) -> ChatSettings:
+        return ChatSettings.from_document(self.get_chat(chat_id) or self[chat_id])
+
+    def _save_settings(self, chat_id: int, tags: List[str], named_tags: Dict[str, Any]) -> None:
+        doc = self.get_chat(chat_id) or self[chat_id]
+        doc['tags'] = tags
+        doc['named_tags'] = named_tags
+        doc.save()
 
-class AutobahnBlacklist(Collection):
+
+class AutobahnBlacklist(BlacklistStore, Collection):
     """Base class for all types of Blacklists."""
     _fields = {
         'string': Field([NotNull()]),
@@ -84,36 +120,77 @@ class AutobahnBlacklist(Collection):
         }
     }
 
-    def add_string(self, string: str) -> Optional[Document]:
-        """Add a Chat to the DB or return an existing one.
+    # indexes ArangoDB._get_collection makes sure exist
+    _index_definitions: List[Dict[str, Any]] = [
+        {'type': 'persistent', 'fields': ['string'], 'unique': True}
+    ]
+
+    def _insert_strings(self, strings: List[str]) -> Dict[str, str]:
+        """Insert the strings that are not in the collection yet with one query.
 
         Args:
-            string: The id of the chat
+            strings: The strings, without duplicates
 
-        Returns: The chat Document
+        Returns: The inserted strings and their new key
 
         """
-        data = {'string': string}
+        # ignoreErrors skips strings another instance added since the lookup
+        result = self.database.AQLQuery('FOR string IN @strings '
+                                        'FILTER FIRST(FOR doc IN @@collection '
+                                        'FILTER doc.string == string '
+                                        'LIMIT 1 RETURN true) == null '
+                                        'INSERT {"string": string} IN @@collection '
+                                        'OPTIONS {ignoreErrors: true} '
+                                        'RETURN NEW',
+                                        rawResults=True, batchSize=1000,
+                                        bindVars={'@collection': self.name, 'strings': strings})
+        return {doc['string']: doc['_key'] for doc in result if doc is not None}
+
+    def _delete_strings(self, strings: List[str]) -> List[str]:
+        """Remove the documents of the strings with one query.
 
-        try:
-            doc = self.createDocument(data)
-            doc.save()
-            return doc
-        except CreationError:
-            return None
+        Args:
+            strings: The strings, without duplicates
+
+        Returns: The strings that had a document
+
+        """
+        return list(self.database.AQLQuery('FOR doc IN @@collection '
+                                           'FILTER doc.string IN @strings '
+                                           'REMOVE doc IN @@collection '
+                                           'RETURN OLD.string',
+                                           rawResults=True, batchSize=1000,
+                                           bindVars={'@collection': self.name,
+                                                     'strings': strings}))
 
-    def get_all(self) -> Dict[str, str]:
-        """Get all strings in the Blacklist."""
+    def _load_strings(self) -> Dict[str, str]:
+        """Fetch all documents of the collection.
+
+        Returns: A dict with the strings and their key
+
+        """
         return {doc['string']: doc['_key'] for doc in self.fetchAll()}
 
+    def _get_revision(self) -> str:
+        """Ask ArangoDB for the revision of the collection.
+
+        Returns: The revision id, it changes with every write to the collection
+
+        """
+        response = self.connection.session.get(f'{self.URL}/revision')
+        return response.json()['revision']
+
+
 class AutobahnBioBlacklist(AutobahnBlacklist):
     """Blacklist with strings in a bio."""
     hex_type = '0x0'
+    index_class = AhoCorasick
 
 
 class AutobahnStringBlacklist(AutobahnBlacklist):
     """Blacklist with strings in a message"""
     hex_type = '0x1'
+    index_class = AhoCorasick
 
 
 class AutobahnFilenameBlacklist(AutobahnBlacklist):
@@ -127,10 +204,12 @@ class AutobahnChannelBlacklist(AutobahnBlacklist):
 
 
 class AutobahnDomainBlacklist(AutobahnBlacklist):
-    """Blacklist with blacklisted domains"""
+    """Blacklist with blacklisted domains, subdomains of them match too"""
     hex_type = '0x4'
+    index_class = DomainTrie
 
-class BanList(Collection):
+
+class BanList(BanListStore, Collection):
     """A list of banned ids and their reason"""
     _fields = {
         'id': Field([NotNull()]),
@@ -147,6 +226,10 @@ class BanList(Collection):
         }
     }
 
+    _index_definitions: List[Dict[str, Any]] = [
+        {'type': 'persistent', 'fields': ['reason']}
+    ]
+
     def add_user(self, _id: int, reason: str) -> Optional[Document]:
         """Add a Chat to the DB or return an existing one.
 
@@ -168,8 +251,83 @@ class BanList(Collection):
         except CreationError:
             return None
 
+    def upsert_bans(self, bans: List[Dict[str, str]]) -> None:
+        """Add the bans or update the reason of existing ones with one query.
+
+        Args:
+            bans: Dicts with the id and reason of each ban
+
+        Returns: None
+
+        """
+        bans = [{'id': str(ban['id']), 'reason': ban['reason']} for ban in bans]
+        self.database.AQLQuery('FOR ban IN @bans '
+                               'UPSERT {"_key": ban.id} '
+                               'INSERT {"_key": ban.id, "id": ban.id, "reason": ban.reason} '
+                               'UPDATE {"reason": ban.reason} '
+                               'IN BanList', rawResults=True, bindVars={'bans': bans})
+
+    def remove_bans(self, uids: List[str]) -> None:
+        """Remove the bans of the users with one query, unknown ids are ignored.
+
+        Args:
+            uids: The user ids
+
+        Returns: None
+
+        """
+        self.database.AQLQuery('FOR uid IN @uids '
+                               'REMOVE {"_key": uid} '
+                               'IN BanList OPTIONS {ignoreErrors: true}',
+                               rawResults=True, bindVars={'uids': [str(uid) for uid in uids]})
+
+    def get_bans(self, uids: List[str]) -> List[Dict[str, str]]:
+        """Return the bans of the users that are on the banlist.
+
+        Args:
+            uids: The user ids
+
+        Returns: A list of dicts with the id and reason
+
+        """
+        return list(self.database.AQLQuery('FOR doc IN BanList '
+                                           'FILTER doc._key IN @ids '
+                                           'RETURN {"id": doc.id, "reason": doc.reason}',
+                                           rawResults=True, batchSize=1000,
+                                           bindVars={'ids': [str(uid) for uid in uids]}))
+
+    def count_bans(self, reason: str) -> int:
+        """Count the bans with a matching reason.
+
+        Args:
+            reason: The LIKE pattern for the reason
 
-class ArangoDB:  # pylint: disable = R0902
+        Returns: The amount of bans
+
+        """
+        # LIKE can't use the index, a pattern without wildcards is an exact lookup
+        if any(char in reason for char in '%_\\'):
+            condition = 'doc.reason LIKE @reason'
+        else:
+            condition = 'doc.reason == @reason'
+        result = self.database.AQLQuery('FOR doc IN BanList '
+                                        f'FILTER {condition} '
+                                        'COLLECT WITH COUNT INTO length '
+                                        'RETURN length',
+                                        rawResults=True, bindVars={'reason': reason})
+        return list(result)[0]
+
+    def _load_ids(self) -> Iterable[str]:
+        """Stream the ids of all banned users.
+
+        Returns: The document keys, fetched in batches of 10000
+
+        """
+        return self.database.AQLQuery('FOR doc IN BanList RETURN doc._key',
+                                      rawResults=True, batchSize=10000)
+
+
+class ArangoDB(StorageBackend):  # pylint: disable = R0902
     """Handle creation of all required Documents."""
 
     def __init__(self) -> None:
@@ -187,14 +345,20 @@ class ArangoDB:  # pylint: disable = R0902
             'AutobahnChannelBlacklist')
         self.ab_domain_blacklist: AutobahnDomainBlacklist = self._get_collection(
             'AutobahnDomainBlacklist')
-        self.ab_collection_map = {
-            '0x0': self.ab_bio_blacklist,
-            '0x1': self.ab_string_blacklist,
-            '0x2': self.ab_filename_blacklist,
-            '0x3': self.ab_channel_blacklist,
-            '0x4': self.ab_domain_blacklist
-        }
         self.banlist: BanList = self._get_collection('BanList')
+        self._setup()
+
+    def index_stats(self) -> List[IndexInfo]:
+        collections = [self.groups, *self.ab_collection_map.values(), self.banlist]
+        stats = []
+        for collection in collections:
+            response = self.conn.session.get(f'{self.db.URL}/index',
+                                             params={'collection': collection.name})
+            for index in response.json()['indexes']:
+                stats.append(IndexInfo(collection.name, tuple(index['fields']), index['type'],
+                                       index.get('unique', False),
+                                       index.get('selectivityEstimate')))
+        return stats
 
     def query(self, query: str, batch_size: int = 100, raw_results: bool = False,
               bind_vars: Dict = None, options: Dict = None,
@@ -232,6 +396,35 @@ class ArangoDB:  # pylint: disable = R0902
 
         """
         if self.db.hasCollection(collection):
-            return self.db[collection]
+            _collection = self.db[collection]
         else:
-            return self.db.createCollection(collection)
+            _collection = self.db.createCollection(collection)
+        self._ensure_indexes(_collection)
+        return _collection
+
+    def _ensure_indexes(self, collection: Collection) -> None:
+        """Create the indexes a collection declares, existing ones are left alone.
+
+        If a unique index can't be created because the collection already contains
+        duplicates a non unique one is created so lookups are still indexed.
+
+        Args:
+            collection: The Collection object
+
+        Returns: None
+
+        """
+        for definition in getattr(collection, '_index_definitions', []):
+            url = f'{self.db.URL}/index'
+            params = {'collection': collection.name}
+            response = self.conn.session.post(url, params=params, data=json.dumps(definition))
+            result = response.json()
+            if result.get('errorNum') == UNIQUE_CONSTRAINT_VIOLATED:
+                logger.warning('%s contains duplicate %s, creating a non unique index',
+                               collection.name, ', '.join(definition['fields']))
+                definition = {**definition, 'unique': False}
+                result = self.conn.session.post(url, params=params,
+                                                data=json.dumps(definition)).json()
+            if result.get('error'):
+                logger.error('Could not create index on %s: %s',
+                             collection.name, result.get('errorMessage'))
@@ -0,0 +1,205 @@
+"""Module containing the asynchronous facade for the storage backends"""
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple, TypeVar
+
+from utils import perf
+
+if TYPE_CHECKING:
+    from database.backend import BlacklistStore, ChatSettings, IndexInfo, StorageBackend
+
+T = TypeVar('T')
+
+
+class AsyncBackend:
+    """Awaitable versions of the database operations.
+
+    The database drivers are synchronous so every call is run in a bounded thread
+    pool instead of blocking the event loop. Lookups that can be answered from the
+    in memory caches skip the thread pool completely.
+
+    Attributes:
+        db: The synchronous storage backend
+        executor: The thread pool the requests are made in
+    """
+
+    def __init__(self, db: 'StorageBackend', max_workers: int = 8) -> None:
+        self.db = db
+        self.executor = ThreadPoolExecutor(max_workers=max_workers,
+                                           thread_name_prefix='kantek-db')
+
+    async def run(self, func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run a blocking function in the thread pool.
+
+        Args:
+            func: The function to call
+            *args: Positional arguments for the function
+            **kwargs: Keyword arguments for the function
+
+        Returns: The return value of the function
+
+        """
+        loop = asyncio.get_event_loop()
+        with perf.span('db'):
+            return await loop.run_in_executor(self.executor,
+                                              functools.partial(func, *args, **kwargs))
+
+    async def get_chat_settings(self, chat_id: int, fresh: bool = False) -> 'ChatSettings':
+        """Awaitable version of ChatStore.get_settings.
+
+        Args:
+            chat_id: The id of the chat
+            fresh: Ignore the cached settings
+
+        Returns: The ChatSettings
+
+        """
+        settings: Optional['ChatSettings'] = None
+        if not fresh:
+            settings = self.db.groups.cached_settings(chat_id)
+        if settings is None:
+            settings = await self.run(self.db.groups.get_settings, chat_id, fresh=fresh)
+        return settings
+
+    async def set_chat_tags(self, chat_id: int, tags: List[str],
+                            named_tags: Dict[str, Any]) -> 'ChatSettings':
+        """Awaitable version of ChatStore.set_tags.
+
+        Args:
+            chat_id: The id of the chat
+            tags: The new tags
+            named_tags: The new named tags
+
+        Returns: The new ChatSettings
+
+        """
+        return await self.run(self.db.groups.set_tags, chat_id, tags, named_tags)
+
+    async def get_tagged_chats(self, tag: str) -> List[int]:
+        """Awaitable version of ChatStore.get_tagged_chats.
+
+        Args:
+            tag: The tag
+
+        Returns: A list of chat ids
+
+        """
+        return await self.run(self.db.groups.get_tagged_chats, tag)
+
+    async def get_blacklist(self, collection: 'BlacklistStore') -> Dict[str, str]:
+        """Awaitable version of BlacklistStore.get_all.
+
+        Args:
+            collection: The blacklist
+
+        Returns: A dict with the strings and their key
+
+        """
+        if not collection.is_fresh:
+            await self.run(collection.sync)
+        return collection.get_cached()
+
+    async def match_blacklist(self, collection: 'BlacklistStore', text: str) -> Optional[str]:
+        """Awaitable version of BlacklistStore.match.
+
+        Args:
+            collection: The blacklist
+            text: The text to search
+
+        Returns: The key of the matching entry or None
+
+        """
+        if not collection.is_fresh:
+            await self.run(collection.sync)
+        return collection.match_cached(text)
+
+    async def add_strings(self, collection: 'BlacklistStore',
+                          strings: List[str]) -> Dict[str, str]:
+        """Awaitable version of BlacklistStore.add_strings.
+
+        Args:
+            collection: The blacklist
+            strings: The blacklisted strings
+
+        Returns: The added strings and their new key
+
+        """
+        return await self.run(collection.add_strings, strings)
+
+    async def delete_strings(self, collection: 'BlacklistStore', strings: List[str]) -> List[str]:
+        """Awaitable version of BlacklistStore.delete_strings.
+
+        Args:
+            collection: The blacklist
+            strings: The blacklisted strings
+
+        Returns: The strings that were found and deleted
+
+        """
+        return await self.run(collection.delete_strings, strings)
+
+    async def get_strings(self, collection: 'BlacklistStore',
+                          keys: Optional[List[str]] = None) -> List[Tuple[str, str]]:
+        """Awaitable version of BlacklistStore.get_strings.
+
+        Args:
+            collection: The blacklist
+            keys: Only return the entries with these keys
+
+        Returns: A list of key, string tuples
+
+        """
+        return await self.run(collection.get_strings, keys)
+
+    async def upsert_bans(self, bans: List[Dict[str, str]]) -> None:
+        """Awaitable version of BanListStore.upsert_bans.
+
+        Args:
+            bans: Dicts with the id and reason of each ban
+
+        Returns: None
+
+        """
+        await self.run(self.db.banlist.upsert_bans, bans)
+
+    async def remove_bans(self, uids: List[str]) -> None:
+        """Awaitable version of BanListStore.remove_bans.
+
+        Args:
+            uids: The user ids
+
+        Returns: None
+
+        """
+        await self.run(self.db.banlist.remove_bans, uids)
+
+    async def get_bans(self, uids: List[str]) -> List[Dict[str, str]]:
+        """Awaitable version of BanListStore.get_bans.
+
+        Args:
+            uids: The user ids
+
+        Returns: A list of dicts with the id and reason
+
+        """
+        return await self.run(self.db.banlist.get_bans, uids)
+
+    async def count_bans(self, reason: str) -> int:
+        """Awaitable version of BanListStore.count_bans.
+
+        Args:
+            reason: The LIKE pattern for the reason
+
+        Returns: The amount of bans
+
+        """
+        return await self.run(self.db.banlist.count_bans, reason)
+
+    async def index_stats(self) -> List['IndexInfo']:
+        """Awaitable version of StorageBackend.index_stats.
+
+        Returns: A list of IndexInfo
+
+        """
+        return await self.run(self.db.index_stats)
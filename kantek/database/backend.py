@@ -0,0 +1,515 @@
+"""Storage interface shared by all database engines.
+
+The classes here contain the in memory caches and indexes, the engines only
+implement the methods that raise NotImplementedError. They are plain base classes
+instead of ABCs because the pyArango collections already use their own metaclass.
+"""
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+import config
+from database.async_backend import AsyncBackend
+from utils.banindex import BanIndex
+from utils.cache import TTLCache
+
+
+@dataclass(frozen=True)
+class ChatSettings:
+    """Read only snapshot of the tags of a chat.
+
+    Attributes:
+        id: The id of the chat
+        tags: Tags of the chat
+        named_tags: Named tags of the chat
+    """
+    id: int
+    tags: Tuple[str, ...]
+    named_tags: Mapping[str, Any]
+
+    @property
+    def gbancmd(self) -> Optional[str]:
+        """The command used to ban users in the chat."""
+        return self.named_tags.get('gbancmd')
+
+    @property
+    def polizei_excluded(self) -> bool:
+        """If the chat is excluded from the polizei plugins."""
+        return self.named_tags.get('polizei') == 'exclude'
+
+    @classmethod
+    def from_document(cls, doc: Any) -> 'ChatSettings':
+        """Create the settings from a chat document."""
+        named_tags = doc['named_tags']
+        if not isinstance(named_tags, dict):
+            named_tags = named_tags.getStore()
+        return cls(doc['id'], tuple(doc['tags']), MappingProxyType(dict(named_tags)))
+
+
+@dataclass(frozen=True)
+class IndexInfo:
+    """Description of an index and how well it narrows down lookups.
+
+    Attributes:
+        collection: The collection or table the index belongs to
+        fields: The indexed fields
+        type: The kind of index, depends on the engine
+        unique: If every value can only exist once
+        selectivity: Distinct values divided by the number of entries, 1 means every
+            lookup finds at most one entry. None if the engine doesn't provide it.
+    """
+    collection: str
+    fields: Tuple[str, ...]
+    type: str
+    unique: bool
+    selectivity: Optional[float]
+
+
+class ChatStore:
+    """Tags of the chats kantek is in.
+
+    The settings are cached by chat id. Entries expire so changes made by other
+    instances are picked up eventually. The cache is read on the event loop and
+    written from the database thread pool, so it is only used with its lock held.
+    """
+    _settings_cache: TTLCache
+    _settings_lock: threading.Lock
+
+    def __new__(cls, *args: Any, **kwargs: Any) -> 'ChatStore':
+        # created here so the engines don't have to call super().__init__
+        self = super().__new__(cls)
+        self._settings_cache = TTLCache(maxsize=10000, ttl=600)
+        self._settings_lock = threading.Lock()
+        return self
+
+    def cached_settings(self, chat_id: int) -> Optional[ChatSettings]:
+        """Return the settings of a chat if they are cached, never blocks on the database.
+
+        Args:
+            chat_id: The id of the chat
+
+        Returns: The ChatSettings or None if they are not cached
+
+        """
+        with self._settings_lock:
+            settings: Optional[ChatSettings] = self._settings_cache.get(chat_id)
+        return settings
+
+    def get_settings(self, chat_id: int, fresh: bool = False) -> ChatSettings:
+        """Return the settings of a chat from memory, fetch them if they are not cached.
+
+        Args:
+            chat_id: The id of the chat
+            fresh: Ignore the cached settings
+
+        Returns: The ChatSettings
+
+        """
+        settings = None if fresh else self.cached_settings(chat_id)
+        if settings is None:
+            settings = self._load_settings(chat_id)
+            with self._settings_lock:
+                self._settings_cache.set(chat_id, settings)
+        return settings
+
+    def set_tags(self, chat_id: int, tags: List[str], named_tags: Dict[str, Any]) -> ChatSettings:
+        """Replace the tags of a chat.
+
+        Args:
+            chat_id: The id of the chat
+            tags: The new tags
+            named_tags: The new named tags
+
+        Returns: The new ChatSettings
+
+        """
+        self._save_settings(chat_id, tags, named_tags)
+        settings = ChatSettings(chat_id, tuple(tags), MappingProxyType(dict(named_tags)))
+        with self._settings_lock:
+            self._settings_cache.set(chat_id, settings)
+        return settings
+
+    def get_tagged_chats(self, tag: str) -> List[int]:
+        """Return the ids of all chats that have a tag or named tag.
+
+        Args:
+            tag: The tag
+
+        Returns: A list of chat ids
+
+        """
+        raise NotImplementedError
+
+    def _load_settings(self, chat_id: int) -> ChatSettings:
+        """Fetch the settings of a chat, creating the chat if it doesn't exist."""
+        raise NotImplementedError
+
+    def _save_settings(self, chat_id: int, tags: List[str], named_tags: Dict[str, Any]) -> None:
+        raise NotImplementedError
+
+
+class BlacklistStore:
+    """Blacklisted strings of one type, identified by a numeric key.
+
+    All strings are kept in memory and only reloaded when the revision of the
+    stored blacklist changed, which is checked at most every `sync_interval` seconds.
+
+    Methods that may check the revision block on the database and have to run in
+    the database thread pool. get_cached and match_cached only read what is in
+    memory, so AsyncBackend calls them on the event loop after syncing.
+
+    A sync builds a new cache and index, a change applies the added and deleted
+    strings to copies of the published ones. Both replace the old ones with a
+    single assignment, so a lookup never sees a half built index.
+    """
+    hex_type: str = ''
+    # seconds between checks if the blacklist was changed by another instance
+    sync_interval: int = 30
+    # class used to build a search index over the strings, None if the type has none
+    index_class: Optional[type] = None
+    # the cached strings and the index over them, always replaced together
+    _snapshot: Optional[Tuple[Dict[str, str], Any]] = None
+    _revision: Optional[str] = None
+    _last_sync: float = 0
+    _lock: threading.Lock
+    # changes every time the cached strings change, used to invalidate derived results
+    version: int = 0
+
+    def __new__(cls, *args: Any, **kwargs: Any) -> 'BlacklistStore':
+        # created here so the engines don't have to call super().__init__
+        self = super().__new__(cls)
+        # only one sync or change builds a new snapshot at a time
+        self._lock = threading.Lock()
+        return self
+
+    def add_string(self, string: str) -> Optional[str]:
+        """Add a string to the Blacklist and the cache.
+
+        Args:
+            string: The blacklisted string
+
+        Returns: The key of the new entry or None if the string already exists
+
+        """
+        return self.add_strings([string]).get(string)
+
+    def add_strings(self, strings: Iterable[str]) -> Dict[str, str]:
+        """Add all strings that are not blacklisted yet in a single operation.
+
+        Duplicates are removed before the strings are sent to the database.
+
+        Args:
+            strings: The blacklisted strings
+
+        Returns: The added strings and their new key
+
+        """
+        with self._lock:
+            added = self._insert_strings(list(dict.fromkeys(strings)))
+            if added:
+                self._apply(added=added)
+        return added
+
+    def delete_string(self, string: str) -> bool:
+        """Remove a string from the Blacklist and the cache.
+
+        Args:
+            string: The blacklisted string
+
+        Returns: True if the string was found and deleted
+
+        """
+        return bool(self.delete_strings([string]))
+
+    def delete_strings(self, strings: Iterable[str]) -> List[str]:
+        """Remove all strings from the Blacklist and the cache in a single operation.
+
+        Args:
+            strings: The blacklisted strings
+
+        Returns: The strings that were found and deleted
+
+        """
+        with self._lock:
+            deleted = self._delete_strings(list(dict.fromkeys(strings)))
+            if deleted:
+                self._apply(deleted=deleted)
+        return deleted
+
+    def get_all(self) -> Dict[str, str]:
+        """Get all strings in the Blacklist.
+
+        The strings are served from memory and only reloaded when the revision
+        changed since the last check. The returned dict must not be modified.
+        This may block, use get_cached on the event loop.
+        """
+        if not self.is_fresh:
+            self.sync()
+        return self.get_cached()
+
+    def get_cached(self) -> Dict[str, str]:
+        """Get all strings from memory without checking for changes.
+
+        Never blocks, the blacklist must have been synced before.
+        The returned dict must not be modified.
+        """
+        return self._published()[0]
+
+    def get_strings(self, keys: Optional[Iterable[str]] = None) -> List[Tuple[str, str]]:
+        """Return entries sorted by their key, after checking for changes.
+
+        Args:
+            keys: Only return the entries with these keys
+
+        Returns: A list of key, string tuples
+
+        """
+        self.sync()
+        entries = [(key, string) for string, key in self.get_cached().items()]
+        if keys is not None:
+            wanted = set(keys)
+            entries = [entry for entry in entries if entry[0] in wanted]
+        return sorted(entries, key=lambda entry: int(entry[0]))
+
+    @property
+    def is_fresh(self) -> bool:
+        """If the cache can be used without checking the revision first."""
+        return (self._snapshot is not None
+                and time.time() - self._last_sync <= self.sync_interval)
+
+    def sync(self, force: bool = False) -> None:
+        """Reload the cache if the blacklist was changed in the database.
+
+        Args:
+            force: Reload even if the revision did not change
+
+        Returns: None
+
+        """
+        with self._lock:
+            revision = self._get_revision()
+            if force or self._snapshot is None or revision != self._revision:
+                cache = self._load_strings()
+                index = None
+                if self.index_class is not None:
+                    index = self.index_class()
+                    for string, key in cache.items():
+                        index.add(string, key)
+                    index.build()
+                self._publish(cache, index)
+                self._revision = revision
+            self._last_sync = time.time()
+
+    def match(self, text: str) -> Optional[str]:
+        """Search the text for any of the blacklisted strings using the index.
+
+        This may block, use match_cached on the event loop.
+
+        Args:
+            text: The text to search
+
+        Returns: The key of the matching entry or None
+
+        """
+        if not self.is_fresh:
+            self.sync()
+        return self.match_cached(text)
+
+    def match_cached(self, text: str) -> Optional[str]:
+        """Search the text using the index in memory without checking for changes.
+
+        Never blocks, the blacklist must have been synced before.
+
+        Args:
+            text: The text to search
+
+        Returns: The key of the matching entry or None
+
+        """
+        key: Optional[str] = self._published()[1].search(text)
+        return key
+
+    def _published(self) -> Tuple[Dict[str, str], Any]:
+        """Return the published cache and index."""
+        snapshot = self._snapshot
+        if snapshot is None:
+            raise RuntimeError(f'{type(self).__name__} was not synced yet')
+        return snapshot
+
+    def _apply(self, added: Optional[Dict[str, str]] = None,
+               deleted: Optional[List[str]] = None) -> None:
+        """Publish copies of the cache and index with the changes, the lock must be held.
+
+        Only the changed strings are applied to the copies, the published snapshot
+        is never modified. Nothing happens if the blacklist was not loaded yet.
+
+        Args:
+            added: The added strings and their keys
+            deleted: The deleted strings
+
+        Returns: None
+
+        """
+        snapshot = self._snapshot
+        if snapshot is None:
+            return
+        cache = dict(snapshot[0])
+        index = snapshot[1].copy() if snapshot[1] is not None else None
+        for string in deleted or []:
+            cache.pop(string, None)
+            if index is not None:
+                index.remove(string)
+        for string, key in (added or {}).items():
+            cache[string] = key
+            if index is not None:
+                index.add(string, key)
+        if index is not None:
+            index.build()
+        self._publish(cache, index)
+
+    def _publish(self, cache: Dict[str, str], index: Any) -> None:
+        """Replace the snapshot, the index must be built since it is never changed again."""
+        self._snapshot = (cache, index)
+        self.version += 1
+
+    def _insert_strings(self, strings: List[str]) -> Dict[str, str]:
+        """Store the strings that don't exist yet and return them with their key."""
+        raise NotImplementedError
+
+    def _delete_strings(self, strings: List[str]) -> List[str]:
+        """Delete the strings and return the ones that existed."""
+        raise NotImplementedError
+
+    def _load_strings(self) -> Dict[str, str]:
+        """Fetch all strings and their keys."""
+        raise NotImplementedError
+
+    def _get_revision(self) -> str:
+        """Return a value that changes whenever the stored blacklist changes."""
+        raise NotImplementedError
+
+
+class BanListStore:
+    """Banned user ids and their ban reason."""
+    _index: Optional[BanIndex] = None
+
+    @property
+    def index(self) -> BanIndex:
+        """In memory index of all banned ids, see load_index."""
+        if self._index is None:
+            self._index = BanIndex()
+        return self._index
+
+    def load_index(self) -> None:
+        """Load the ids of all banned users into the in memory index."""
+        self.index.load(self._load_ids())
+
+    def upsert_bans(self, bans: List[Dict[str, str]]) -> None:
+        """Add bans or update the reason of existing ones.
+
+        Args:
+            bans: Dicts with the id and reason of each ban
+
+        Returns: None
+
+        """
+        raise NotImplementedError
+
+    def remove_bans(self, uids: List[str]) -> None:
+        """Remove bans, ids that are not banned are ignored.
+
+        Args:
+            uids: The user ids
+
+        Returns: None
+
+        """
+        raise NotImplementedError
+
+    def get_bans(self, uids: List[str]) -> List[Dict[str, str]]:
+        """Return the id and reason of the banned users among the ids.
+
+        Args:
+            uids: The user ids
+
+        Returns: A list of dicts with the id and reason
+
+        """
+        raise NotImplementedError
+
+    def count_bans(self, reason: str) -> int:
+        """Count the bans with a reason matching a case sensitive LIKE pattern.
+
+        Args:
+            reason: The pattern, % matches any text and _ a single character
+
+        Returns: The amount of bans
+
+        """
+        raise NotImplementedError
+
+    def _load_ids(self) -> Iterable[str]:
+        raise NotImplementedError
+
+
+class StorageBackend:  # pylint: disable = R0902
+    """A database engine with all collections kantek uses.
+
+    Attributes:
+        groups: The tags of all chats
+        ab_bio_blacklist: Blacklisted strings in bios
+        ab_string_blacklist: Blacklisted strings in messages
+        ab_filename_blacklist: Blacklisted file names
+        ab_channel_blacklist: Blacklisted channel ids
+        ab_domain_blacklist: Blacklisted domains
+        ab_collection_map: The blacklists by their hex type
+        banlist: The banned users
+        aio: Awaitable versions of the operations
+    """
+    groups: ChatStore
+    ab_bio_blacklist: BlacklistStore
+    ab_string_blacklist: BlacklistStore
+    ab_filename_blacklist: BlacklistStore
+    ab_channel_blacklist: BlacklistStore
+    ab_domain_blacklist: BlacklistStore
+    banlist: BanListStore
+
+    def _setup(self) -> None:
+        """Build the attributes shared by all engines once the collections exist."""
+        self.ab_collection_map: Dict[str, BlacklistStore] = {
+            '0x0': self.ab_bio_blacklist,
+            '0x1': self.ab_string_blacklist,
+            '0x2': self.ab_filename_blacklist,
+            '0x3': self.ab_channel_blacklist,
+            '0x4': self.ab_domain_blacklist
+        }
+        self.aio = AsyncBackend(self)
+
+    def index_stats(self) -> List[IndexInfo]:
+        """Return the indexes of all collections with their selectivity.
+
+        Returns: A list of IndexInfo
+
+        """
+        raise NotImplementedError
+
+
+def create_backend() -> StorageBackend:
+    """Create the database engine selected by `db_backend` in the config.
+
+    `arango` is used if the config doesn't set it. The engines are imported here so
+    pyArango is only needed when ArangoDB is used.
+
+    Returns: The storage backend
+
+    """
+    backend = getattr(config, 'db_backend', 'arango')
+    if backend == 'sqlite':
+        from database.sqlite import SQLiteDB  # pylint: disable = C0415
+        return SQLiteDB(getattr(config, 'db_path', 'kantek.db'))
+    if backend == 'arango':
+        from database.arango import ArangoDB  # pylint: disable = C0415
+        return ArangoDB()
+    raise ValueError(f'Unknown database backend {backend!r}, use arango or sqlite')
@@ -0,0 +1,241 @@
+"""Module containing the embedded SQLite storage backend"""
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+from database.backend import (BanListStore, BlacklistStore, ChatSettings, ChatStore,
+                              IndexInfo, StorageBackend)
+from utils.ahocorasick import AhoCorasick
+from utils.domaintrie import DomainTrie
+
+BLACKLIST_TABLES = ['AutobahnBioBlacklist', 'AutobahnStringBlacklist',
+                    'AutobahnFilenameBlacklist', 'AutobahnChannelBlacklist',
+                    'AutobahnDomainBlacklist']
+
+# the origin column of PRAGMA index_list
+INDEX_ORIGINS = {'c': 'index', 'u': 'unique', 'pk': 'primary'}
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS Chats (
+    id INTEGER PRIMARY KEY,
+    tags TEXT NOT NULL DEFAULT '[]',
+    named_tags TEXT NOT NULL DEFAULT '{}'
+);
+-- one row per tag and named tag so tagged chats can be found with the index
+CREATE TABLE IF NOT EXISTS ChatTags (
+    tag TEXT NOT NULL,
+    chat_id INTEGER NOT NULL,
+    PRIMARY KEY (tag, chat_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ChatTags_chat_id ON ChatTags (chat_id);
+CREATE TABLE IF NOT EXISTS BanList (
+    id TEXT PRIMARY KEY,
+    reason TEXT NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS BanList_reason ON BanList (reason);
+CREATE TABLE IF NOT EXISTS Revisions (
+    name TEXT PRIMARY KEY,
+    revision INTEGER NOT NULL DEFAULT 0
+) WITHOUT ROWID;
+'''
+
+# the string column has no type so channel ids stay integers like in ArangoDB
+BLACKLIST_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS {table} (
+    key INTEGER PRIMARY KEY AUTOINCREMENT,
+    string NOT NULL UNIQUE
+);
+INSERT OR IGNORE INTO Revisions (name) VALUES ('{table}');
+CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON {table} BEGIN
+    UPDATE Revisions SET revision = revision + 1 WHERE name = '{table}';
+END;
+CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON {table} BEGIN
+    UPDATE Revisions SET revision = revision + 1 WHERE name = '{table}';
+END;
+'''
+
+
+class SQLiteChats(ChatStore):
+    """Chats and their tags stored in SQLite"""
+
+    def __init__(self, db: 'SQLiteDB') -> None:
+        self.db = db
+
+    def get_tagged_chats(self, tag: str) -> List[int]:
+        """Return the ids of all chats that have a tag or named tag.
+
+        Args:
+            tag: The tag
+
+        Returns: A list of chat ids
+
+        """
+        rows = self.db.connection.execute('SELECT chat_id FROM ChatTags WHERE tag = ?', (tag,))
+        return [chat_id for chat_id, in rows]
+
+    def _load_settings(self, chat_id: int) -> ChatSettings:
+        row = self.db.connection.execute('SELECT tags, named_tags FROM Chats WHERE id = ?',
+                                         (chat_id,)).fetchone()
+        if row is None:
+            with self.db.transaction() as conn:
+                conn.execute('INSERT OR IGNORE INTO Chats (id) VALUES (?)', (chat_id,))
+            return ChatSettings.from_document({'id': chat_id, 'tags': [], 'named_tags': {}})
+        tags, named_tags = row
+        return ChatSettings.from_document({'id': chat_id,
+                                           'tags': json.loads(tags),
+                                           'named_tags': json.loads(named_tags)})
+
+    def _save_settings(self, chat_id: int, tags: List[str], named_tags: Dict[str, Any]) -> None:
+        with self.db.transaction() as conn:
+            conn.execute('INSERT OR REPLACE INTO Chats (id, tags, named_tags) VALUES (?, ?, ?)',
+                         (chat_id, json.dumps(tags), json.dumps(named_tags)))
+            conn.execute('DELETE FROM ChatTags WHERE chat_id = ?', (chat_id,))
+            conn.executemany('INSERT OR IGNORE INTO ChatTags (tag, chat_id) VALUES (?, ?)',
+                             [(tag, chat_id) for tag in [*tags, *named_tags]])
+
+
+class SQLiteBlacklist(BlacklistStore):
+    """A blacklist stored in its own SQLite table"""
+
+    def __init__(self, db: 'SQLiteDB', table: str, hex_type: str,
+                 index_class: Optional[type] = None) -> None:
+        self.db = db
+        self.table = table
+        self.hex_type = hex_type
+        self.index_class = index_class
+
+    def _insert_strings(self, strings: List[str]) -> Dict[str, str]:
+        added = {}
+        with self.db.transaction() as conn:
+            for string in strings:
+                # an ignored insert would still use up a key, the keys are shown to users
+                exists = conn.execute(f'SELECT 1 FROM {self.table} WHERE string = ?',
+                                      (string,)).fetchone()
+                if exists is None:
+                    cursor = conn.execute(f'INSERT INTO {self.table} (string) VALUES (?)',
+                                          (string,))
+                    added[string] = str(cursor.lastrowid)
+        return added
+
+    def _delete_strings(self, strings: List[str]) -> List[str]:
+        deleted = []
+        with self.db.transaction() as conn:
+            for string in strings:
+                cursor = conn.execute(f'DELETE FROM {self.table} WHERE string = ?', (string,))
+                if cursor.rowcount:
+                    deleted.append(string)
+        return deleted
+
+    def _load_strings(self) -> Dict[str, str]:
+        rows = self.db.connection.execute(f'SELECT string, key FROM {self.table}')
+        return {string: str(key) for string, key in rows}
+
+    def _get_revision(self) -> str:
+        row = self.db.connection.execute('SELECT revision FROM Revisions WHERE name = ?',
+                                         (self.table,)).fetchone()
+        return str(row[0])
+
+
+class SQLiteBanList(BanListStore):
+    """Banned users stored in SQLite"""
+
+    def __init__(self, db: 'SQLiteDB') -> None:
+        self.db = db
+
+    def upsert_bans(self, bans: List[Dict[str, str]]) -> None:
+        with self.db.transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO BanList (id, reason) VALUES (?, ?)',
+                             [(str(ban['id']), ban['reason']) for ban in bans])
+
+    def remove_bans(self, uids: List[str]) -> None:
+        with self.db.transaction() as conn:
+            conn.executemany('DELETE FROM BanList WHERE id = ?', [(str(uid),) for uid in uids])
+
+    def get_bans(self, uids: List[str]) -> List[Dict[str, str]]:
+        uids = [str(uid) for uid in uids]
+        bans = []
+        # stay below the limit of variables in a statement
+        for start in range(0, len(uids), 500):
+            chunk = uids[start:start + 500]
+            placeholders = ', '.join('?' * len(chunk))
+            rows = self.db.connection.execute(
+                f'SELECT id, reason FROM BanList WHERE id IN ({placeholders})', chunk)
+            bans += [{'id': uid, 'reason': reason} for uid, reason in rows]
+        return bans
+
+    def count_bans(self, reason: str) -> int:
+        row = self.db.connection.execute('SELECT COUNT(*) FROM BanList WHERE reason LIKE ?',
+                                         (reason,)).fetchone()
+        return row[0]
+
+    def _load_ids(self) -> Iterable[str]:
+        return (uid for uid, in self.db.connection.execute('SELECT id FROM BanList'))
+
+
+class SQLiteDB(StorageBackend):  # pylint: disable = R0902
+    """Embedded storage for single instance deployments.
+
+    The database runs in WAL mode so the lookups of the thread pool don't block
+    each other or the writes. Every thread gets its own connection.
+
+    Attributes:
+        path: The database file
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._local = threading.local()
+        schema = SCHEMA + ''.join(BLACKLIST_SCHEMA.format(table=table)
+                                  for table in BLACKLIST_TABLES)
+        self.connection.executescript(f'BEGIN;{schema}COMMIT;')
+        self.groups = SQLiteChats(self)
+        self.ab_bio_blacklist = SQLiteBlacklist(self, 'AutobahnBioBlacklist', '0x0', AhoCorasick)
+        self.ab_string_blacklist = SQLiteBlacklist(self, 'AutobahnStringBlacklist', '0x1',
+                                                   AhoCorasick)
+        self.ab_filename_blacklist = SQLiteBlacklist(self, 'AutobahnFilenameBlacklist', '0x2')
+        self.ab_channel_blacklist = SQLiteBlacklist(self, 'AutobahnChannelBlacklist', '0x3')
+        self.ab_domain_blacklist = SQLiteBlacklist(self, 'AutobahnDomainBlacklist', '0x4',
+                                                   DomainTrie)
+        self.banlist = SQLiteBanList(self)
+        self._setup()
+
+    def index_stats(self) -> List[IndexInfo]:
+        conn = self.connection
+        stats = []
+        for table in ['Chats', 'ChatTags', 'BanList', 'Revisions', *BLACKLIST_TABLES]:
+            total, = conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()
+            # INTEGER PRIMARY KEY columns are the rowid and have no entry in the index list
+            for _, name, unique, origin, _ in conn.execute(f'PRAGMA index_list({table})'):
+                fields = [column for _, _, column in conn.execute(f'PRAGMA index_info({name})')]
+                distinct, = conn.execute(f'SELECT COUNT(*) FROM (SELECT DISTINCT '
+                                         f'{", ".join(fields)} FROM {table})').fetchone()
+                stats.append(IndexInfo(table, tuple(fields), INDEX_ORIGINS.get(origin, origin),
+                                       bool(unique), distinct / total if total else 1.0))
+        return stats
+
+    @property
+    def connection(self) -> sqlite3.Connection:
+        """The connection of the current thread."""
+        conn = getattr(self._local, 'connection', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute('PRAGMA journal_mode = WAL')
+            conn.execute('PRAGMA synchronous = NORMAL')
+            # like ArangoDB, also lets LIKE patterns with a fixed prefix use the index
+            conn.execute('PRAGMA case_sensitive_like = ON')
+            self._local.connection = conn
+        return conn
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Run the statements in the block in a single transaction."""
+        conn = self.connection
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
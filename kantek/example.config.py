@@ -15,7 +15,15 @@ gban_group = ''
 # This is regex so make sure to escape the usual characters
 cmd_prefix: str = r'\.'
 
+# Either arango or sqlite. sqlite stores everything in db_path and needs no server
+# but should only be used by a single kantek instance
+db_backend: str = 'arango'
+db_path: str = 'kantek.db'
+
 db_username = 'kantek'
 db_name = 'kantek'
 db_password = 'PASSWORD'
 db_host = 'http://127.0.0.1:8529'
+
+# File the Prometheus metrics are written to every 15 seconds
+metrics_file: str = 'tmp/kantek.prom'
@@ -1,22 +1,22 @@
 """Plugin to manage the autobahn"""
+import asyncio
 import logging
 import re
+from typing import List, Tuple, Union
 from urllib import parse
 
-import requests
-from pyArango.document import Document
-from requests import ConnectionError
 from telethon import events
 from telethon.events import NewMessage
 from telethon.tl.patched import Message
 
 from config import cmd_prefix
-from database.arango import ArangoDB
+from database.backend import StorageBackend
 from utils import helpers, parsers
 from utils.client import KantekClient
-from utils.mdtex import Bold, Code, KeyValueItem, MDTeXDocument, Pre, Section, SubSection
+from utils.mdtex import (Bold, Code, FormattedBase, KeyValueItem, MDTeXDocument, Pre, Section,
+                         SubSection)
 
-__version__ = '0.2.0'
+__version__ = '0.4.0'
 
 tlog = logging.getLogger('kantek-channel-log')
 
@@ -37,7 +37,7 @@ async def autobahn(event: NewMessage.Event) -> None:
     """Command to manage autobahn blacklists"""
     client: KantekClient = event.client
     msg: Message = event.message
-    db: ArangoDB = client.db
+    db: StorageBackend = client.db
     args = msg.raw_text.split()[1:]
 
     response = ''
@@ -54,63 +54,76 @@ async def autobahn(event: NewMessage.Event) -> None:
         await client.respond(event, response)
 
 
-async def _add_string(event: NewMessage.Event, db: ArangoDB) -> MDTeXDocument:
-    """Add a string to the Collection of its type"""
-    msg: Message = event.message
-    args = msg.raw_text.split()[2:]
-    _, args = parsers.parse_arguments(' '.join(args))
-    string_type = args[0]
-    strings = args[1:]
+async def _add_string(event: NewMessage.Event, db: StorageBackend) -> MDTeXDocument:
+    """Add strings to the Collection of their type with a single query"""
+    string_type, strings = await _get_strings(event)
+    hex_type = AUTOBAHN_TYPES.get(string_type)
+    collection = db.ab_collection_map.get(hex_type)
     added_items = []
-    for string in strings:
-        hex_type = AUTOBAHN_TYPES.get(string_type)
-        collection = db.ab_collection_map.get(hex_type)
-        if hex_type is None or collection is None:
-            continue
-        if hex_type == '0x3':
-            link_creator, chat_id, random_part = await helpers.resolve_invite_link(string)
-            string = chat_id
-        elif hex_type == '0x4':
-            string = await helpers.resolve_url(string)
-
-        existing_one = collection.fetchByExample({'string': string}, batchSize=1)
-        if not existing_one:
-            collection.add_string(string)
-            added_items.append(Code(string))
+    if collection is not None:
+        strings = await _resolve_strings(hex_type, strings, resolve_urls=True)
+        added_items = list(await db.aio.add_strings(collection, strings))
     return MDTeXDocument(Section(Bold('Added Items:'),
                                  SubSection(Bold(string_type),
-                                            *added_items)))
+                                            *_format_items(added_items))))
 
 
-async def _del_string(event: NewMessage.Event, db: ArangoDB) -> MDTeXDocument:
-    """Add a string to the Collection of its type"""
-    msg: Message = event.message
-    args = msg.raw_text.split()[2:]
-    _, args = parsers.parse_arguments(' '.join(args))
-    string_type = args[0]
-    strings = args[1:]
+async def _del_string(event: NewMessage.Event, db: StorageBackend) -> MDTeXDocument:
+    """Remove strings from the Collection of their type with a single query"""
+    string_type, strings = await _get_strings(event)
+    hex_type = AUTOBAHN_TYPES.get(string_type)
+    collection = db.ab_collection_map.get(hex_type)
     removed_items = []
-    for string in strings:
-        hex_type = AUTOBAHN_TYPES.get(string_type)
-        collection = db.ab_collection_map.get(hex_type)
-        if hex_type is None or collection is None:
-            continue
-
-        if hex_type == '0x3':
-            link_creator, chat_id, random_part = await helpers.resolve_invite_link(string)
-            string = chat_id
-
-        existing_one: Document = collection.fetchFirstExample({'string': string})
-        if existing_one:
-            existing_one[0].delete()
-            removed_items.append(string)
-
+    if collection is not None:
+        strings = await _resolve_strings(hex_type, strings, resolve_urls=False)
+        removed_items = await db.aio.delete_strings(collection, strings)
     return MDTeXDocument(Section(Bold('Deleted Items:'),
                                  SubSection(Bold(string_type),
-                                            *removed_items)))
+                                            *_format_items(removed_items))))
+
 
+async def _get_strings(event: NewMessage.Event) -> Tuple[str, List[str]]:
+    """Return the type and the strings from the arguments.
 
-async def _query_string(event: NewMessage.Event, db: ArangoDB) -> MDTeXDocument:
+    If the command replies to a text file every non empty line of it is added to the strings.
+    """
+    msg: Message = event.message
+    args = msg.raw_text.split()[2:]
+    _, args = parsers.parse_arguments(' '.join(args))
+    string_type = args[0]
+    strings = args[1:]
+    if msg.is_reply:
+        reply_msg: Message = await msg.get_reply_message()
+        document = reply_msg.document
+        if document is not None and document.mime_type.startswith('text/'):
+            content: bytes = await reply_msg.download_media(bytes)
+            strings += [line.strip() for line in content.decode('utf-8', 'replace').splitlines()
+                        if line.strip()]
+    return string_type, strings
+
+
+async def _resolve_strings(hex_type: str, strings: List[str],
+                           resolve_urls: bool) -> List[Union[str, int]]:
+    """Resolve invite links to channel ids and urls to domains concurrently.
+
+    Duplicates are only resolved once and invite links that can't be parsed are dropped.
+    """
+    strings = list(dict.fromkeys(strings))
+    if hex_type == '0x3':
+        links = await asyncio.gather(*[helpers.resolve_invite_link(s) for s in strings])
+        return [chat_id for _, chat_id, _ in links if chat_id is not None]
+    elif hex_type == '0x4' and resolve_urls:
+        return list(await asyncio.gather(*[helpers.resolve_url(s) for s in strings]))
+    return strings
+
+
+def _format_items(strings: List[Union[str, int]]) -> List[FormattedBase]:
+    if len(strings) > 100:
+        return [KeyValueItem(Bold('Count'), Code(len(strings)))]
+    return [Code(string) for string in strings]
+
+
+async def _query_string(event: NewMessage.Event, db: StorageBackend) -> MDTeXDocument:
     """Add a string to the Collection of its type"""
     msg: Message = event.message
     args = msg.raw_text.split()[2:]
@@ -128,27 +141,26 @@ async def _query_string(event: NewMessage.Event, db: ArangoDB) -> MDTeXDocument:
         hex_type = AUTOBAHN_TYPES.get(string_type)
         collection = db.ab_collection_map[hex_type]
     if code is None and code_range is None:
-        all_strings = collection.fetchAll()
+        all_strings = await db.aio.get_strings(collection)
         if not len(all_strings) > 100:
-            items = [KeyValueItem(Bold(f'0x{doc["_key"]}'.rjust(5)),
-                                  Code(doc['string'])) for doc in all_strings]
+            items = [KeyValueItem(Bold(f'0x{key}'.rjust(5)),
+                                  Code(string)) for key, string in all_strings]
         else:
-            items = [Pre(', '.join([doc['string'] for doc in all_strings]))]
+            items = [Pre(', '.join([str(string) for _, string in all_strings]))]
         return MDTeXDocument(Section(Bold(f'Strings for {string_type}[{hex_type}]'), *items))
 
     elif hex_type is not None and code is not None:
         db_key = code.split('x')[-1]
-        string = collection.fetchDocument(db_key).getStore()['string']
+        strings = await db.aio.get_strings(collection, [db_key])
+        if not strings:
+            return MDTeXDocument(Section(Bold('Error'), f'No string with the code {code}'))
+        _, string = strings[0]
         return MDTeXDocument(Section(Bold(f'String for {string_type}[{code}]'), Code(string)))
 
     elif hex_type is not None and code_range is not None:
         start, stop = [int(c.split('x')[-1]) for c in code_range.split('-')]
         keys = [str(i) for i in range(start, stop + 1)]
-        documents = db.query(f'FOR doc IN @@collection '
-                             'FILTER doc._key in @keys '
-                             'RETURN doc',
-                             bind_vars={'@collection': collection.name,
-                                        'keys': keys})
-        items = [KeyValueItem(Bold(f'0x{doc["_key"]}'.rjust(5)),
-                              Code(doc['string'])) for doc in documents]
+        strings = await db.aio.get_strings(collection, keys)
+        items = [KeyValueItem(Bold(f'0x{key}'.rjust(5)),
+                              Code(string)) for key, string in strings]
         return MDTeXDocument(Section(Bold(f'Strings for {string_type}[{hex_type}]'), *items))
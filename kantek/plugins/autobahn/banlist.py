@@ -1,29 +1,37 @@
 """Plugin to manage the banlist of the bot."""
+import contextlib
+import hashlib
+import itertools
+import json
 import logging
 import os
 import time
+from typing import Optional
 
 from telethon import events
 from telethon.events import NewMessage
 from telethon.tl.patched import Message
 
 from config import cmd_prefix
-from database.arango import ArangoDB
+from database.backend import StorageBackend
 from utils import helpers, parsers
 from utils.client import KantekClient
 from utils.mdtex import Bold, Code, Italic, KeyValueItem, MDTeXDocument, Section
 
-__version__ = '0.1.0'
+__version__ = '0.3.1'
 
 tlog = logging.getLogger('kantek-channel-log')
 
+IMPORT_BATCH_SIZE = 5000
+CHECKPOINT_FILE = 'tmp/banlist_import.json'
+
 
 @events.register(events.NewMessage(outgoing=True, pattern=f'{cmd_prefix}b(an)?l(ist)?'))
 async def banlist(event: NewMessage.Event) -> None:
     """Command to query and manage the banlist."""
     client: KantekClient = event.client
     msg: Message = event.message
-    db: ArangoDB = client.db
+    db: StorageBackend = client.db
     args = msg.raw_text.split()[1:]
     response = ''
     if not args:
@@ -32,52 +40,97 @@ async def banlist(event: NewMessage.Event) -> None:
         response = await _query_banlist(event, db)
     elif args[0] == 'import':
         waiting_message = await client.respond(event, 'Import bans. This might take a while.')
-        response = await _import_banlist(event, db)
+        response = await _import_banlist(event, db, waiting_message)
         await waiting_message.delete()
     if response:
         await client.respond(event, response)
 
 
-async def _query_banlist(event: NewMessage.Event, db: ArangoDB) -> MDTeXDocument:
+async def _query_banlist(event: NewMessage.Event, db: StorageBackend) -> MDTeXDocument:
     msg: Message = event.message
     args = msg.raw_text.split()[2:]
     keyword_args, args = parsers.parse_arguments(' '.join(args))
     reason = keyword_args.get('reason')
     users = []
     if args:
-        users = db.query('For doc in BanList '
-                         'FILTER doc._key in @ids '
-                         'RETURN doc', bind_vars={'ids': args})
+        users = await db.aio.get_bans(args)
         query_results = [KeyValueItem(Code(user['id']), user['reason'])
                          for user in users] or [Italic('None')]
     if reason is not None:
-        result = db.query('FOR doc IN BanList '
-                          'FILTER doc.reason LIKE @reason '
-                          'COLLECT WITH COUNT INTO length '
-                          'RETURN length', bind_vars={'reason': reason})
-        query_results = [KeyValueItem(Bold('Count'), Code(result))]
+        count = await db.aio.count_bans(reason)
+        query_results = [KeyValueItem(Bold('Count'), Code(count))]
     return MDTeXDocument(Section(Bold('Query Results'), *query_results))
 
 
-async def _import_banlist(event: NewMessage.Event, db: ArangoDB) -> MDTeXDocument:
+async def _import_banlist(event: NewMessage.Event, db: StorageBackend,
+                          progress_message: Optional[Message] = None) -> MDTeXDocument:
+    """Import a Rose CSV in batches.
+
+    The file is parsed lazily in the database thread pool and every batch is
+    committed on its own. After each batch a checkpoint is written so an interrupted
+    import of the same file continues after the last committed batch.
+    """
     msg: Message = event.message
     filename = 'tmp/banlist_import.csv'
     if msg.is_reply:
         reply_msg: Message = await msg.get_reply_message()
         _, ext = os.path.splitext(reply_msg.document.attributes[0].file_name)
         if ext == '.csv':
-            await reply_msg.download_media('tmp/banlist_import.csv')
+            await reply_msg.download_media(filename)
             start_time = time.time()
-            _banlist = await helpers.rose_csv_to_dict(filename)
-            if _banlist:
-                db.query('FOR ban in @banlist '
-                         'UPSERT {"_key": ban.id} '
-                         'INSERT ban '
-                         'UPDATE {"reason": ban.reason} '
-                         'IN BanList', bind_vars={'banlist': _banlist})
+            file_hash = await db.aio.run(_hash_file, filename)
+            resumed_from = _load_checkpoint(file_hash)
+            bans = itertools.islice(helpers.iter_rose_csv(filename), resumed_from, None)
+            imported = resumed_from
+            last_edit = start_time
+            while True:
+                batch = await db.aio.run(lambda: list(itertools.islice(bans, IMPORT_BATCH_SIZE)))
+                if not batch:
+                    break
+                await db.aio.upsert_bans(batch)
+                db.banlist.index.update(ban['id'] for ban in batch)
+                imported += len(batch)
+                _save_checkpoint(file_hash, imported)
+                if progress_message is not None and time.time() - last_edit > 5:
+                    last_edit = time.time()
+                    rate = (imported - resumed_from) / (last_edit - start_time)
+                    progress = Section(Bold('Import'),
+                                       KeyValueItem(Bold('Imported'), imported),
+                                       KeyValueItem(Bold('Rows/s'), f'{rate:.0f}'))
+                    await progress_message.edit(str(progress))
+            # no checkpoint is written if the file has no rows
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(CHECKPOINT_FILE)
             stop_time = time.time() - start_time
             return MDTeXDocument(Section(Bold('Import Result'),
-                                         f'Added {len(_banlist)} entries.'),
+                                         f'Added {imported - resumed_from} entries.',
+                                         (f'Resumed after {resumed_from} entries.'
+                                          if resumed_from else None)),
                                  Italic(f'Took {stop_time:.02f}s'))
         else:
             return MDTeXDocument(Section(Bold('Error'), 'File is not a CSV'))
+
+
+def _hash_file(filename: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(65536), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _load_checkpoint(file_hash: str) -> int:
+    """Return the amount of already committed rows if the last import of this file failed."""
+    try:
+        with open(CHECKPOINT_FILE, encoding='utf-8') as f:
+            checkpoint = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    if checkpoint.get('hash') != file_hash:
+        return 0
+    return checkpoint.get('rows', 0)
+
+
+def _save_checkpoint(file_hash: str, rows: int) -> None:
+    with open(CHECKPOINT_FILE, 'w', encoding='utf-8') as f:
+        json.dump({'hash': file_hash, 'rows': rows}, f)
@@ -2,7 +2,6 @@
 import asyncio
 import datetime
 import logging
-from typing import Dict
 
 from telethon import events
 from telethon.events import NewMessage
@@ -15,7 +14,7 @@ from config import cmd_prefix
 from utils import helpers
 from utils.client import KantekClient
 
-__version__ = '0.1.0'
+__version__ = '0.1.1'
 
 tlog = logging.getLogger('kantek-channel-log')
 
@@ -33,9 +32,7 @@ async def gban(event: NewMessage.Event) -> None:
     fban = keyword_args.get('fban', True)
     await msg.delete()
     if msg.is_reply:
-        chat_document = client.db.groups.get_chat(event.chat_id)
-        db_named_tags: Dict = chat_document['named_tags'].getStore()
-        bancmd = db_named_tags.get('gbancmd')
+        bancmd = (await client.db.aio.get_chat_settings(event.chat_id)).gbancmd
         reply_msg: Message = await msg.get_reply_message()
         uid = reply_msg.from_id
         if args:
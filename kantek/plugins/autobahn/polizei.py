@@ -1,25 +1,35 @@
 """Plugin that automatically bans according to a blacklist"""
 import asyncio
 import datetime
+import hashlib
 import logging
-from typing import Dict
+from typing import Any, Dict, List, Optional, Tuple, Union
 
 from telethon import events
 from telethon.events import ChatAction, NewMessage
 from telethon.tl.functions.channels import EditBannedRequest
-from telethon.tl.functions.users import GetFullUserRequest
 from telethon.tl.patched import Message
-from telethon.tl.types import (Channel, ChannelParticipantsAdmins, ChatBannedRights,
-                               MessageEntityTextUrl, UserFull)
+from telethon.tl.types import Channel, ChatBannedRights, MessageEntityTextUrl, UserFull
 
-from database.arango import ArangoDB
+from database.backend import StorageBackend
 from utils import helpers
+from utils.cache import TTLCache
 from utils.client import KantekClient
 
-__version__ = '0.1.0'
+__version__ = '0.5.5'
 
 tlog = logging.getLogger('kantek-channel-log')
 
+KNOWN_SPAMMER_REASON = 'spam[banlist]'
+
+# ban type and ban reason of a message, both False if it is clean
+Verdict = Tuple[Union[str, bool], Union[str, bool]]
+
+# user id -> (bio blacklist version, matched key or None) of users whose bio was checked
+BIO_VERDICTS = TTLCache(maxsize=10000, ttl=600)
+# message fingerprint -> (blacklist versions, (ban type, ban reason)) of checked messages
+MESSAGE_VERDICTS = TTLCache(maxsize=10000, ttl=600)
+
 
 @events.register(events.MessageEdited(outgoing=False))
 @events.register(events.NewMessage(outgoing=False))
@@ -27,41 +37,57 @@ async def polizei(event: NewMessage.Event) -> None:
     """Plugin to automatically ban users for certain messages."""
     client: KantekClient = event.client
     chat: Channel = await event.get_chat()
-    db: ArangoDB = client.db
-    chat_document = db.groups.get_chat(event.chat_id)
-    db_named_tags: Dict = chat_document['named_tags'].getStore()
-    bancmd = db_named_tags.get('gbancmd')
-    polizei_tag = db_named_tags.get('polizei')
-    if polizei_tag == 'exclude':
+    db: StorageBackend = client.db
+    settings = await db.aio.get_chat_settings(event.chat_id)
+    if settings.polizei_excluded:
+        return
+    if await _is_known_spammer(event, event.message.from_id, event.message.text):
+        await _banuser(event, chat, event.message.from_id, settings.gbancmd)
         return
     ban_type, ban_reason = await _check_message(event)
     if ban_type and ban_reason:
-        await _banuser(event, chat, event.message.from_id, bancmd, ban_type, ban_reason)
+        await _banuser(event, chat, event.message.from_id, settings.gbancmd,
+                       ban_type, ban_reason)
 
 
 @events.register(events.chataction.ChatAction())
 async def biopolizei(event: ChatAction.Event) -> None:
-    """Plugin to ban users with blacklisted strings in their bio."""
+    """Plugin to ban users with blacklisted strings in their bio.
+
+    The bio of a user is only checked once per version of the bio blacklist, users
+    joining multiple chats reuse that verdict.
+    """
+    if not (event.user_joined or event.user_added):
+        return
     client: KantekClient = event.client
     chat: Channel = await event.get_chat()
-    db: ArangoDB = client.db
-    chat_document = db.groups.get_chat(event.chat_id)
-    db_named_tags: Dict = chat_document['named_tags'].getStore()
-    bancmd = db_named_tags.get('gbancmd')
-    polizei_tag = db_named_tags.get('polizei')
-    if polizei_tag == 'exclude':
+    db: StorageBackend = client.db
+    settings = await db.aio.get_chat_settings(event.chat_id)
+    if settings.polizei_excluded:
         return
-    ban_type, ban_reason = False, False
-    bio_blacklist = db.ab_bio_blacklist.get_all()
-    user: UserFull = await client(GetFullUserRequest(await event.get_input_user()))
-    for string in bio_blacklist:
-        if string in user.about:
-            ban_type, ban_reason = db.ab_bio_blacklist.hex_type, bio_blacklist[string]
-    if ban_type and ban_reason:
-        await _banuser(event, chat, event.user_id, bancmd, ban_type, ban_reason)
+    if await _is_known_spammer(event, event.user_id):
+        await _banuser(event, chat, event.user_id, settings.gbancmd)
+        return
+    await db.aio.get_blacklist(db.ab_bio_blacklist)
+    version = db.ab_bio_blacklist.version
+    verdict = BIO_VERDICTS.get(event.user_id)
+    if verdict is not None and verdict[0] == version:
+        if verdict[1]:
+            await _banuser(event, chat, event.user_id, settings.gbancmd)
+        return
+    user: UserFull = await client.get_full_user(await event.get_input_user())
+    ban_reason = await db.aio.match_blacklist(db.ab_bio_blacklist, user.about or '')
+    BIO_VERDICTS.set(event.user_id, (version, ban_reason))
+    if ban_reason:
+        await _banuser(event, chat, event.user_id, settings.gbancmd,
+                       db.ab_bio_blacklist.hex_type, ban_reason)
+
 
+async def _banuser(event, chat, userid, bancmd, ban_type=None, ban_reason=None):
+    """Ban a user in the chat and gban them for the given ban type and reason.
 
-async def _banuser(event, chat, userid, bancmd, ban_type, ban_reason):
+    Users that are already on the banlist are only banned in the chat.
+    """
     client: KantekClient = event.client
     if chat.creator or chat.admin_rights:
         await event.delete()
@@ -74,23 +100,33 @@ async def _banuser(event, chat, userid, bancmd, ban_type, ban_reason):
                 )
             ))
         elif bancmd is not None:
-            await client.respond(event, f'{bancmd} {ban_reason}')
+            await client.respond(event, f'{bancmd} {ban_reason or KNOWN_SPAMMER_REASON}')
             await asyncio.sleep(0.25)
         await event.delete()
-    await client.gban(userid, f'Spambot[kv2 {ban_type} 0x{ban_reason.rjust(4, "0")}]')
+    if ban_type is not None:
+        await client.gban(userid, f'Spambot[kv2 {ban_type} 0x{ban_reason.rjust(4, "0")}]')
 
 
-async def _check_message(event):
+async def _is_known_spammer(event: Union[NewMessage.Event, ChatAction.Event], userid: int,
+                            text: Optional[str] = None) -> bool:
+    """Check if a user is on the banlist and may be banned in the chat of the event."""
+    if not (event.is_group or event.is_channel):
+        return False
+    if userid not in event.client.db.banlist.index:
+        return False
+    return not await _is_exempt(event, userid, text)
+
+
+async def _is_exempt(event: Union[NewMessage.Event, ChatAction.Event], userid: int,
+                     text: Optional[str] = None) -> bool:
+    """Check if a user must never be banned automatically."""
     client: KantekClient = event.client
-    msg: Message = event.message
     # exclude users below a certain id to avoid banning "legit" users
-    if msg.from_id < 610000000:
-        return False, False
+    if userid < 610000000:
+        return True
 
-    admins = [p.id for p in (await client.get_participants(event.chat_id,
-                                                           filter=ChannelParticipantsAdmins()))]
-    if msg.from_id in admins:
-        return False, False
+    if await client.is_admin(event.chat_id, userid):
+        return True
 
     # commands used in bots to blacklist items, these will be used by admins
     # so they shouldnt be banned for it
@@ -98,26 +134,59 @@ async def _check_message(event):
         '/addblacklist',
     ]
     for cmd in blacklisting_commands:
-        if msg.text and msg.text.startswith(cmd):
-            return False, False
+        if text and text.startswith(cmd):
+            return True
+    return False
+
+
+async def _check_message(event: NewMessage.Event) -> Verdict:
+    client: KantekClient = event.client
+    msg: Message = event.message
+    if await _is_exempt(event, msg.from_id, msg.text):
+        return False, False
 
-    db: ArangoDB = client.db
-    string_blacklist = db.ab_string_blacklist.get_all()
-    channel_blacklist = db.ab_channel_blacklist.get_all()
-    domain_blacklist = db.ab_domain_blacklist.get_all()
+    db: StorageBackend = client.db
+    channel_blacklist = await db.aio.get_blacklist(db.ab_channel_blacklist)
+    await db.aio.get_blacklist(db.ab_domain_blacklist)
+    await db.aio.get_blacklist(db.ab_string_blacklist)
+    versions = (db.ab_channel_blacklist.version,
+                db.ab_domain_blacklist.version,
+                db.ab_string_blacklist.version)
     entities = [e[1] for e in msg.get_entities_text()]
+    urls = [e.url for e in msg.entities or [] if isinstance(e, MessageEntityTextUrl)]
+    fingerprint = _fingerprint(msg.raw_text, entities, urls)
+    cached: Optional[Tuple[Tuple[int, int, int], Verdict]] = MESSAGE_VERDICTS.get(fingerprint)
+    if cached is not None and cached[0] == versions:
+        return cached[1]
+    verdict = await _check_content(db, msg, entities, urls, channel_blacklist)
+    MESSAGE_VERDICTS.set(fingerprint, (versions, verdict))
+    return verdict
+
+
+def _fingerprint(text: Optional[str], entities: List[str], urls: List[str]) -> str:
+    """Hash everything the blacklist checks of a message depend on."""
+    parts = [text or ''] + entities + [''] + urls
+    return hashlib.sha1('\x00'.join(parts).encode('utf-8', 'surrogatepass')).hexdigest()
+
+
+async def _check_content(db: StorageBackend, msg: Message, entities: List[str], urls: List[str],
+                         channel_blacklist: Dict[Any, str]) -> Verdict:
+    """Check the text, invite links and urls of a message against the blacklists.
+
+    The keys of the channel blacklist are channel ids, not strings.
+    """
     for e in entities:
         link_creator, chat_id, random_part = await helpers.resolve_invite_link(e)
         if chat_id in channel_blacklist.keys():
             return db.ab_channel_blacklist.hex_type, channel_blacklist[chat_id]
 
-    for string in string_blacklist:
-        if string in msg.raw_text:
-            return db.ab_string_blacklist.hex_type, string_blacklist[string]
-    if msg.entities:
-        for entity in msg.entities:
-            if isinstance(entity, MessageEntityTextUrl):
-                domain = await helpers.resolve_url(entity.url)
-                if domain in domain_blacklist:
-                    return db.ab_domain_blacklist.hex_type, domain_blacklist[domain]
+    string_ban = await db.aio.match_blacklist(db.ab_string_blacklist, msg.raw_text)
+    if string_ban:
+        return db.ab_string_blacklist.hex_type, string_ban
+    if urls:
+        domains = await asyncio.gather(*[helpers.resolve_url(url) for url in urls])
+        for domain in domains:
+            domain_ban = await db.aio.match_blacklist(db.ab_domain_blacklist, domain)
+            if domain_ban:
+                return db.ab_domain_blacklist.hex_type, domain_ban
     return False, False
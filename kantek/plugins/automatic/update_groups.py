@@ -6,7 +6,7 @@ from telethon.events import NewMessage
 
 from utils.client import KantekClient
 
-__version__ = '0.1.0'
+__version__ = '0.1.1'
 
 tlog = logging.getLogger('kantek-channel-log')
 
@@ -24,4 +24,4 @@ async def add_groups(event: NewMessage.Event) -> None:
     if event.is_private:
         return
     client: KantekClient = event.client
-    client.db.groups.get_chat(event.chat_id)
+    await client.db.aio.get_chat_settings(event.chat_id)
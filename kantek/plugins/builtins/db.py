@@ -0,0 +1,52 @@
+"""Plugin to inspect the database kantek uses."""
+import logging
+from itertools import groupby
+from typing import List
+
+from telethon import events
+from telethon.events import NewMessage
+from telethon.tl.patched import Message
+
+from config import cmd_prefix
+from database.backend import StorageBackend
+from utils.client import KantekClient
+from utils.mdtex import Bold, Code, Italic, KeyValueItem, MDTeXDocument, Section, SubSection
+
+__version__ = '0.1.0'
+
+tlog = logging.getLogger('kantek-channel-log')
+
+
+@events.register(events.NewMessage(outgoing=True, pattern=f'{cmd_prefix}db'))
+async def db_info(event: NewMessage.Event) -> None:
+    """Show information about the database.
+
+    `indexes` lists the indexes of every collection with their selectivity.
+    """
+    client: KantekClient = event.client
+    msg: Message = event.message
+    db: StorageBackend = client.db
+    args = msg.raw_text.split()[1:]
+    response = ''
+    if args and args[0] == 'indexes':
+        response = await _index_stats(db)
+    if response:
+        await client.respond(event, response)
+    tlog.info('Ran `db` in `%s`', event.chat.title)
+
+
+async def _index_stats(db: StorageBackend) -> MDTeXDocument:
+    stats = await db.aio.index_stats()
+    sections: List[SubSection] = []
+    for collection, indexes in groupby(stats, key=lambda index: index.collection):
+        items = []
+        for index in indexes:
+            selectivity = ('n/a' if index.selectivity is None
+                           else f'{index.selectivity:.2%}')
+            unique = ' unique' if index.unique else ''
+            items.append(KeyValueItem(Code(', '.join(index.fields)),
+                                      f'{index.type}{unique}, selectivity {selectivity}'))
+        sections.append(SubSection(Bold(collection), *items))
+    return MDTeXDocument(Section(Bold('Indexes'), *sections),
+                         Italic('Selectivity is the share of distinct values, '
+                                'higher is better for lookups'))
@@ -10,7 +10,7 @@ from telethon.tl.types import Chat
 from config import cmd_prefix
 from utils.client import KantekClient
 
-__version__ = '0.1.0'
+__version__ = '0.1.2'
 
 tlog = logging.getLogger('kantek-channel-log')
 
@@ -32,7 +32,11 @@ async def tag(event: NewMessage.Event) -> None:
         'version': client.kantek_version,
         'telethon version': telethon.__version__,
         'python version': platform.python_version(),
-        'plugins loaded': len(client.plugin_mgr.active_plugins)
+        'plugins loaded': len(client.plugin_mgr.active_plugins),
+        'gban queue': (f'{client.gban_worker.queue_depth} queued, '
+                       f'{client.gban_worker.processed} processed, '
+                       f'{client.gban_worker.failed} failed, '
+                       f'{client.gban_worker.latency:.02f}s avg latency')
     }
 
     response += [f'  **{k}:**\n    `{v}`' for k, v in _info.items() if v is not None]
@@ -0,0 +1,56 @@
+"""Plugin to show where kantek spends its time."""
+import datetime
+import logging
+from typing import List
+
+from telethon import events
+from telethon.events import NewMessage
+
+from config import cmd_prefix
+from utils import helpers, perf
+from utils.client import KantekClient
+from utils.mdtex import Bold, Code, Italic, KeyValueItem, MDTeXDocument, Section, SubSection
+
+__version__ = '0.1.0'
+
+tlog = logging.getLogger('kantek-channel-log')
+
+
+@events.register(events.NewMessage(outgoing=True, pattern=f'{cmd_prefix}perf'))
+async def perf_stats(event: NewMessage.Event) -> None:
+    """Show call counts, errors and latencies of the plugin callbacks.
+
+    `reset: true` clears the statistics, `limit: <n>` sets how many of the slowest
+    callbacks are shown.
+    """
+    client: KantekClient = event.client
+    keyword_args, _ = await helpers.get_args(event)
+    registry = perf.REGISTRY
+    if keyword_args.get('reset', False):
+        registry.reset()
+        await client.respond(event, 'Reset the performance statistics.')
+        return
+    limit = int(keyword_args.get('limit', 10))
+    handlers = sorted(registry.handlers.items(),
+                      key=lambda item: item[1].latency.sum, reverse=True)[:limit]
+    sections: List[SubSection] = []
+    for name, stats in handlers:
+        items = [KeyValueItem('calls', Code(stats.calls)),
+                 KeyValueItem('errors', Code(stats.errors)),
+                 KeyValueItem('latency', Code(_format_latency(stats.latency)))]
+        for kind, histogram in sorted(stats.spans.items()):
+            items.append(KeyValueItem(kind, Code(f'{histogram.count}x '
+                                                 f'{_format_latency(histogram)}')))
+        sections.append(SubSection(Bold(name), *items))
+    since = datetime.datetime.fromtimestamp(registry.started)
+    response = MDTeXDocument(
+        Section(Bold('Performance'), *sections),
+        Italic(f'Collected since {since:%Y-%m-%d %H:%M}, p50/p95 are bucket bounds'))
+    await client.respond(event, response)
+    tlog.info('Ran `perf` in `%s`', event.chat.title)
+
+
+def _format_latency(histogram: perf.Histogram) -> str:
+    return (f'avg {histogram.mean * 1000:.1f}ms '
+            f'p50 {histogram.quantile(0.5) * 1000:g}ms '
+            f'p95 {histogram.quantile(0.95) * 1000:g}ms')
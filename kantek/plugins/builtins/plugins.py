@@ -10,7 +10,7 @@ from config import cmd_prefix
 from utils.client import KantekClient
 from utils.pluginmgr import PluginManager
 
-__version__ = '0.1.0'
+__version__ = '0.2.0'
 
 logger: Logger = logzero.logger
 
@@ -38,6 +38,8 @@ async def plugins(event: NewMessage.Event) -> None:
             response = await _plugins_list(pluginmgr)
         elif cmd in ['unregister', 'ur']:
             response = await _plugins_unregister(event, pluginmgr)
+        elif cmd in ['reload', 'rl']:
+            response = await _plugins_reload(event, pluginmgr)
     await client.respond(event, response)
 
 
@@ -52,7 +54,8 @@ async def _plugins_list(pluginmgr: PluginManager) -> str:
     """
     plugin_list = []
     for plugin in pluginmgr.active_plugins:
-        plugin_list.append(f'**{plugin.path} [{plugin.version}]:**')
+        plugin_list.append(f'**{plugin.path} [{plugin.version}]:** '
+                           f'__{plugin.load_time * 1000:.0f}ms__')
         for callback in plugin.callbacks:
             prefix = "[private]" if callback.private else "[public]"
             plugin_list.append(f'  {prefix} {callback.name}')
@@ -80,3 +83,32 @@ async def _plugins_unregister(event: NewMessage.Event,
         pluginmgr.unregister_all()
 
     return 'Unregistered all non builtins.'
+
+
+async def _plugins_reload(event: NewMessage.Event,
+                          pluginmgr: PluginManager) -> str:
+    """Reload plugins from their files.
+
+    Args:
+        event: The event with the command
+        pluginmgr: The plugin manager instance
+
+    Returns:
+
+    """
+    args = event.message.raw_text.split()[2:]
+    if not args:
+        return 'No arguments specified.'
+    response = []
+    for path in args:
+        try:
+            plugin = pluginmgr.reload_plugin(path)
+        except Exception as err:  # pylint: disable = W0703
+            logger.exception(err)
+            response.append(f'Could not reload `{path}`: `{err}`')
+            continue
+        if plugin is None:
+            response.append(f'Unregistered `{path}`, the file does not exist.')
+        else:
+            response.append(f'Reloaded `{plugin.path}` [{plugin.version}]')
+    return '\n'.join(response)
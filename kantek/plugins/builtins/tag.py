@@ -8,12 +8,12 @@ from telethon.tl.patched import Message
 from telethon.tl.types import Chat, Message
 
 from config import cmd_prefix
-from database.arango import ArangoDB
+from database.backend import StorageBackend
 from utils import parsers
 from utils.client import KantekClient
 from utils.mdtex import Bold, Code, Item, KeyValueItem, Section
 
-__version__ = '0.1.0'
+__version__ = '0.2.0'
 
 tlog = logging.getLogger('kantek-channel-log')
 
@@ -30,17 +30,15 @@ async def tag(event: NewMessage.Event) -> None:
     """
     chat: Chat = event.chat
     client: KantekClient = event.client
-    db: ArangoDB = client.db
-    chat_document = client.db.groups.get_chat(event.chat_id)
+    db: StorageBackend = client.db
+    settings = await db.aio.get_chat_settings(event.chat_id)
     msg: Message = event.message
     args = msg.raw_text.split()[1:]
     response = ''
     if not args:
-        db_named_tags: Dict = chat_document['named_tags'].getStore()
-        db_tags: List = chat_document['tags']
         data = []
-        data += [KeyValueItem(Bold(key), value) for key, value in db_named_tags.items()]
-        data += [Item(_tag) for _tag in db_tags]
+        data += [KeyValueItem(Bold(key), value) for key, value in settings.named_tags.items()]
+        data += [Item(_tag) for _tag in settings.tags]
         if not data:
             data.append(Code('None'))
         response = Section(Item(f'Tags for **{chat.title}**[`{event.chat_id}`]:'),
@@ -58,7 +56,7 @@ async def tag(event: NewMessage.Event) -> None:
     tlog.info('Ran `tag` in `%s`. Response: %s', chat.title, response)
 
 
-async def _add_tags(event: NewMessage.Event, db: ArangoDB):
+async def _add_tags(event: NewMessage.Event, db: StorageBackend):
     """Add tags to chat.
 
     Args:
@@ -69,21 +67,19 @@ async def _add_tags(event: NewMessage.Event, db: ArangoDB):
     """
     msg: Message = event.message
     args = msg.raw_text.split()[2:]
-    chat_document = db.groups[event.chat_id]
-    db_named_tags: Dict = chat_document['named_tags'].getStore()
-    db_tags: List = chat_document['tags']
+    settings = await db.aio.get_chat_settings(event.chat_id, fresh=True)
+    db_named_tags: Dict = dict(settings.named_tags)
+    db_tags: List = list(settings.tags)
     named_tags, tags = parsers.parse_arguments(' '.join(args))
     for k, v in named_tags.items():
         db_named_tags[k] = v
     for _tag in tags:
         if _tag not in db_tags:
             db_tags.append(_tag)
-    chat_document['named_tags'] = db_named_tags
-    chat_document['tags'] = db_tags
-    chat_document.save()
+    await db.aio.set_chat_tags(event.chat_id, db_tags, db_named_tags)
 
 
-async def _clear_tags(event: NewMessage.Event, db: ArangoDB):
+async def _clear_tags(event: NewMessage.Event, db: StorageBackend):
     """Remove all tags from a chat.
 
     Args:
@@ -92,13 +88,10 @@ async def _clear_tags(event: NewMessage.Event, db: ArangoDB):
 
     Returns: A string with the action taken.
     """
-    chat_document = db.groups[event.chat_id]
-    chat_document['named_tags'] = {}
-    chat_document['tags'] = []
-    chat_document.save()
+    await db.aio.set_chat_tags(event.chat_id, [], {})
 
 
-async def _delete_tags(event: NewMessage.Event, db: ArangoDB):
+async def _delete_tags(event: NewMessage.Event, db: StorageBackend):
     """Delete the specified tags from a chat.
 
     Args:
@@ -109,14 +102,12 @@ async def _delete_tags(event: NewMessage.Event, db: ArangoDB):
     """
     msg: Message = event.message
     args = msg.raw_text.split()[2:]
-    chat_document = db.groups[event.chat_id]
-    db_named_tags: Dict = chat_document['named_tags'].getStore()
-    db_tags: List = chat_document['tags']
+    settings = await db.aio.get_chat_settings(event.chat_id, fresh=True)
+    db_named_tags: Dict = dict(settings.named_tags)
+    db_tags: List = list(settings.tags)
     for arg in args:
         if arg in db_named_tags:
             del db_named_tags[arg]
-            db_named_tags = db_named_tags
         if arg in db_tags:
             del db_tags[db_tags.index(arg)]
-    chat_document['named_tags'] = db_named_tags
-    chat_document.save()
+    await db.aio.set_chat_tags(event.chat_id, db_tags, db_named_tags)
@@ -1,6 +1,5 @@
 """Plugin to get information about a channel."""
 import logging
-from typing import Dict, List
 
 from telethon import events
 from telethon.events import NewMessage
@@ -10,7 +9,7 @@ from config import cmd_prefix
 from utils.client import KantekClient
 from utils.mdtex import Bold, Code, Item, KeyValueItem, MDTeXDocument, Section
 
-__version__ = '0.1.0'
+__version__ = '0.1.2'
 
 tlog = logging.getLogger('kantek-channel-log')
 
@@ -53,17 +52,17 @@ async def info(event: NewMessage.Event) -> None:
         if user.deleted:
             deleted_accounts += 1
 
+    client.participant_counts.set(event.chat_id, total_users)
     user_stats = Section('user stats:',
                          KeyValueItem(Bold('total_users'), Code(total_users)),
                          KeyValueItem(Bold('bots'), Code(bot_accounts)),
                          KeyValueItem(Bold('deleted_accounts'), Code(deleted_accounts)))
 
-    chat_document = client.db.groups.get_chat(event.chat_id)
-    db_named_tags: Dict = chat_document['named_tags'].getStore()
-    db_tags: List = chat_document['tags']
+    settings = await client.db.aio.get_chat_settings(event.chat_id)
     data = []
-    data += [KeyValueItem(Bold(key), ', '.join(value)) for key, value in db_named_tags.items()]
-    data += [Item(_tag) for _tag in db_tags]
+    data += [KeyValueItem(Bold(key), ', '.join(value))
+             for key, value in settings.named_tags.items()]
+    data += [Item(_tag) for _tag in settings.tags]
     tags = Section('tags:', *data)
     info_msg = MDTeXDocument(chat_info, user_stats, tags)
     await client.respond(event, info_msg)
@@ -1,27 +1,28 @@
 """Plugin to remove deleted Accounts from a group"""
 import asyncio
-import datetime
 import logging
 from typing import Optional
 
 import logzero
 from telethon import events
-from telethon.errors import FloodWaitError, UserAdminInvalidError
+from telethon.errors import RPCError
 from telethon.events import NewMessage
-from telethon.tl.functions.channels import EditBannedRequest
 from telethon.tl.patched import Message
-from telethon.tl.types import (Channel, ChannelParticipantsAdmins, ChatBannedRights, User)
+from telethon.tl.types import Channel
 
 from config import cmd_prefix
 from utils import helpers
+from utils.cleanup import CleanupEngine
 from utils.client import KantekClient
 from utils.mdtex import Bold, KeyValueItem, MDTeXDocument, Section
 
-__version__ = '0.3.0'
+__version__ = '0.5.4'
 
 tlog = logging.getLogger('kantek-channel-log')
 logger: logging.Logger = logzero.logger
 
+PROGRESS_INTERVAL = 5
+
 
 @events.register(events.NewMessage(outgoing=True, pattern=f'{cmd_prefix}cleanup'))
 async def cleanup(event: NewMessage.Event) -> None:
@@ -29,16 +30,31 @@ async def cleanup(event: NewMessage.Event) -> None:
     chat: Channel = await event.get_chat()
     client: KantekClient = event.client
     keyword_args, _ = await helpers.get_args(event)
-    count_only = keyword_args.get('count', False)
+    count_only: bool = keyword_args.get('count') is True
     silent = keyword_args.get('silent', False)
-    if not chat.creator and not chat.admin_rights:
+    try:
+        workers = int(keyword_args.get('workers', 5))
+    except ValueError:
+        workers = 0
+    if workers < 1:
+        await client.respond(event, MDTeXDocument(
+            Section(Bold('Error'), 'workers must be a number of at least 1')))
+        return
+    # only the account itself may start a network cleanup, not group admins
+    network = keyword_args.get('network') if event.message.out else None
+    if not network and not chat.creator and not chat.admin_rights:
         count_only = True
     waiting_message = None
     if silent:
         await event.message.delete()
     else:
         waiting_message = await client.respond(event, 'Starting cleanup. This might take a while.')
-    response = await _cleanup_chat(event, count=count_only, progress_message=waiting_message)
+    if network:
+        response = await _cleanup_network(event, network, count=count_only, workers=workers,
+                                          progress_message=waiting_message)
+    else:
+        response = await _cleanup_chat(event, count=count_only, workers=workers,
+                                       progress_message=waiting_message)
     if not silent:
         await client.respond(event, response, reply=False)
     if waiting_message:
@@ -51,63 +67,93 @@ async def cleanup_group_admins(event: NewMessage.Event) -> None:
     if event.is_channel:
         msg: Message = event.message
         client: KantekClient = event.client
-        async for p in client.iter_participants(event.chat_id, filter=ChannelParticipantsAdmins):
-            if msg.from_id == p.id:
-                await cleanup(event)
-                break
+        if await client.is_admin(event.chat_id, msg.from_id):
+            await cleanup(event)
 
 
-async def _cleanup_chat(event, count: bool = False,
+async def _cleanup_chat(event: NewMessage.Event, count: bool = False, workers: int = 5,
                         progress_message: Optional[Message] = None) -> MDTeXDocument:
     chat: Channel = await event.get_chat()
     client: KantekClient = event.client
-    user: User
-    deleted_users = 0
-    deleted_admins = 0
-    user_counter = 0
-    participant_count = (await client.get_participants(chat, limit=0)).total
-    # the number will be 0 if the group has less than 25 participants
-    modulus = (participant_count // 25) or 1
-    async for user in client.iter_participants(chat):
-        if progress_message is not None and user_counter % modulus == 0:
-            progress = Section(Bold('Cleanup'),
-                               KeyValueItem(Bold('Progress'),
-                                            f'{user_counter}/{participant_count}'),
-                               KeyValueItem(Bold('Deleted Accounts'), deleted_users))
-            await progress_message.edit(str(progress))
-        user_counter += 1
-        if user.deleted:
-            deleted_users += 1
-            if not count:
-                try:
-                    await client(EditBannedRequest(
-                        chat, user, ChatBannedRights(
-                            until_date=datetime.datetime(2038, 1, 1),
-                            view_messages=True
-                        )
-                    ))
-                except UserAdminInvalidError:
-                    deleted_admins += 1
-                except FloodWaitError as error:
-                    if progress_message is not None:
-                        progress = Section(Bold('Cleanup | FloodWait'),
-                                           Bold(f'Got FloodWait for {error.seconds}s. Sleeping.'),
-                                           KeyValueItem(Bold('Progress'),
-                                                        f'{user_counter}/{participant_count}'),
-                                           KeyValueItem(Bold('Deleted Accounts'), deleted_users))
-                        await progress_message.edit(str(progress))
+    engine = CleanupEngine(client, concurrency=workers)
+    reporter = None
+    if progress_message is not None:
+        reporter = asyncio.ensure_future(_report_progress(engine, progress_message))
+    try:
+        await engine.run(chat, count_only=count)
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+    stats = engine.stats
+    return MDTeXDocument(
+        Section(Bold('Cleanup'),
+                KeyValueItem(Bold('Deleted Accounts'), stats.deleted_accounts),
+                KeyValueItem(Bold('Deleted Admins'),
+                             stats.deleted_admins) if stats.deleted_admins else None,
+                KeyValueItem(Bold('Failed'), stats.failed) if stats.failed else None,
+                KeyValueItem(Bold('Removed/s'), f'{stats.rate:.02f}') if stats.banned else None))
 
-                    tlog.error(error)
-                    logger.error(error)
-                    await asyncio.sleep(error.seconds)
-                    await client(EditBannedRequest(
-                        chat, user, ChatBannedRights(
-                            until_date=datetime.datetime(2038, 1, 1),
-                            view_messages=True
-                        )
-                    ))
 
+async def _cleanup_network(event: NewMessage.Event, tag: str, count: bool = False,
+                           workers: int = 5,
+                           progress_message: Optional[Message] = None) -> MDTeXDocument:
+    """Clean up all chats with a tag in parallel with one shared rate limit."""
+    client: KantekClient = event.client
+    chat_ids = await client.db.aio.get_tagged_chats(tag)
+    chats = []
+    for chat_id in chat_ids:
+        try:
+            entity = await client.get_entity(chat_id)
+        except ValueError:
+            continue
+        if isinstance(entity, Channel) and entity.megagroup:
+            chats.append(entity)
+    engine = CleanupEngine(client, concurrency=workers)
+    reporter = None
+    if progress_message is not None:
+        reporter = asyncio.ensure_future(_report_progress(engine, progress_message))
+    try:
+        await engine.run_network(chats, count_only=count)
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+    stats = engine.stats
     return MDTeXDocument(
-        Section(Bold('Cleanup'),
-                KeyValueItem(Bold('Deleted Accounts'), deleted_users),
-                KeyValueItem(Bold('Deleted Admins'), deleted_admins) if deleted_admins else None))
+        Section(Bold(f'Network Cleanup [{tag}]'),
+                KeyValueItem(Bold('Chats'), len(chats)),
+                KeyValueItem(Bold('Failed Chats'),
+                             len(engine.failed_chats)) if engine.failed_chats else None,
+                KeyValueItem(Bold('Participants'), stats.participants),
+                KeyValueItem(Bold('Deleted Accounts'), stats.deleted_accounts),
+                KeyValueItem(Bold('Removed'), stats.banned),
+                KeyValueItem(Bold('Deleted Admins'),
+                             stats.deleted_admins) if stats.deleted_admins else None,
+                KeyValueItem(Bold('Failed'), stats.failed) if stats.failed else None,
+                KeyValueItem(Bold('Removed/s'), f'{stats.rate:.02f}') if stats.banned else None,
+                KeyValueItem(Bold('FloodWaits'),
+                             engine.limiter.flood_waits) if engine.limiter.flood_waits else None))
+
+
+async def _report_progress(engine: CleanupEngine, progress_message: Message) -> None:
+    """Periodically show the progress of a cleanup in the progress message."""
+    while True:
+        await asyncio.sleep(PROGRESS_INTERVAL)
+        stats = engine.stats
+        limiter = engine.limiter
+        if limiter.paused_for:
+            header = Bold(f'Cleanup | FloodWait for {limiter.paused_for:.0f}s')
+        else:
+            header = Bold('Cleanup')
+        progress = Section(header,
+                           KeyValueItem(Bold('Chats'), f'{engine.chats_done}/{engine.chats_total}')
+                           if engine.chats_total else None,
+                           KeyValueItem(Bold('Progress'),
+                                        f'{stats.scanned}/{stats.participants}'),
+                           KeyValueItem(Bold('Deleted Accounts'), stats.deleted_accounts),
+                           KeyValueItem(Bold('Removed'), stats.banned),
+                           KeyValueItem(Bold('Removed/s'), f'{stats.rate:.02f}'))
+        try:
+            await progress_message.edit(str(progress))
+        except RPCError as error:
+            # keep reporting, the next edit may succeed
+            logger.warning('Could not update the cleanup progress: %s', error)
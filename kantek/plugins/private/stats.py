@@ -1,103 +1,125 @@
 """Plugin to get statistics of the user account"""
+import datetime
 import logging
 import time
 
 from telethon import events
-from telethon.events import NewMessage
-from telethon.tl.custom import Dialog
-from telethon.tl.types import Channel, Chat, User
+from telethon.events import ChatAction, MessageRead, NewMessage
 
 from config import cmd_prefix
 from utils import helpers
+from utils.accountstats import AccountStats
 from utils.client import KantekClient
 from utils.mdtex import Bold, Italic, KeyValueItem, MDTeXDocument, Section, SubSection
 
-__version__ = '0.1.0'
+__version__ = '0.3.1'
 
 tlog = logging.getLogger('kantek-channel-log')
 
 
 @events.register(events.NewMessage(outgoing=True, pattern=f'{cmd_prefix}stats'))
-async def stats(event: NewMessage.Event) -> None:  # pylint: disable = R0912, R0914, R0915
-    """Command to get stats about the account"""
+async def stats(event: NewMessage.Event) -> None:
+    """Command to get stats about the account
+
+    The statistics are kept up to date from updates. `rescan: true` goes through all
+    dialogs again to correct any drift, `fresh: true` also refetches the participant counts.
+    """
     client: KantekClient = event.client
-    waiting_message = await client.respond(event, 'Collecting stats. This might take a while.')
+    account_stats: AccountStats = client.account_stats
+    keyword_args, _ = await helpers.get_args(event)
+    fresh = keyword_args.get('fresh', False)
+    rescan = keyword_args.get('rescan', False) or fresh or not account_stats.last_rescan
     start_time = time.time()
-    private_chats = 0
-    bots = 0
-    groups = 0
-    broadcast_channels = 0
-    admin_in_groups = 0
-    creator_in_groups = 0
-    admin_in_broadcast_channels = 0
-    creator_in_channels = 0
-    unread_mentions = 0
-    unread = 0
-    largest_group_member_count = 0
-    largest_group_with_admin = 0
-    dialog: Dialog
-    async for dialog in client.iter_dialogs():
-        entity = dialog.entity
-
-        if isinstance(entity, Channel):
-            participants_count = (await client.get_participants(dialog, limit=0)).total
-            if entity.broadcast:
-                broadcast_channels += 1
-                if entity.creator or entity.admin_rights:
-                    admin_in_broadcast_channels += 1
-                if entity.creator:
-                    creator_in_channels += 1
-
-            elif entity.megagroup:
-                groups += 1
-                if participants_count > largest_group_member_count:
-                    largest_group_member_count = participants_count
-                if entity.creator or entity.admin_rights:
-                    if participants_count > largest_group_with_admin:
-                        largest_group_with_admin = participants_count
-                    admin_in_groups += 1
-                if entity.creator:
-                    creator_in_groups += 1
-
-        elif isinstance(entity, User):
-            private_chats += 1
-            if entity.bot:
-                bots += 1
-
-        elif isinstance(entity, Chat):
-            groups += 1
-            if entity.creator or entity.admin_rights:
-                admin_in_groups += 1
-            if entity.creator:
-                creator_in_groups += 1
-
-        unread_mentions += dialog.unread_mentions_count
-        unread += dialog.unread_count
+    if rescan:
+        waiting_message = await client.respond(event, 'Collecting stats. This might take a while.')
+        await account_stats.rescan(client, fresh=fresh)
+        await waiting_message.delete()
+    summary = account_stats.summary()
     stop_time = time.time() - start_time
+    last_rescan = datetime.datetime.fromtimestamp(account_stats.last_rescan)
 
     full_name = await helpers.get_full_name(await client.get_me())
     response = MDTeXDocument(Section(
         Bold(f'Stats for {full_name}'),
         SubSection(
-            KeyValueItem(Bold('Private Chats'), private_chats),
-            KeyValueItem(Bold('Users'), private_chats - bots),
-            KeyValueItem(Bold('Bots'), bots)),
-        KeyValueItem(Bold('Groups'), groups),
-        KeyValueItem(Bold('Channels'), broadcast_channels),
+            KeyValueItem(Bold('Private Chats'), summary['private_chats']),
+            KeyValueItem(Bold('Users'), summary['private_chats'] - summary['bots']),
+            KeyValueItem(Bold('Bots'), summary['bots'])),
+        KeyValueItem(Bold('Groups'), summary['groups']),
+        KeyValueItem(Bold('Channels'), summary['broadcast_channels']),
         SubSection(
-            KeyValueItem(Bold('Admin in Groups'), admin_in_groups),
-            KeyValueItem(Bold('Creator'), creator_in_groups),
-            KeyValueItem(Bold('Admin Rights'), admin_in_groups - creator_in_groups)),
+            KeyValueItem(Bold('Admin in Groups'), summary['admin_in_groups']),
+            KeyValueItem(Bold('Creator'), summary['creator_in_groups']),
+            KeyValueItem(Bold('Admin Rights'),
+                         summary['admin_in_groups'] - summary['creator_in_groups'])),
         SubSection(
-            KeyValueItem(Bold('Admin in Channels'), admin_in_broadcast_channels),
-            KeyValueItem(Bold('Creator'), creator_in_channels),
-            KeyValueItem(Bold('Admin Rights'), admin_in_broadcast_channels - creator_in_channels)),
-        KeyValueItem(Bold('Unread'), unread),
-        KeyValueItem(Bold('Unread Mentions'), unread_mentions),
-        KeyValueItem(Bold('Largest Group'), largest_group_member_count),
-        KeyValueItem(Bold('Largest Group with Admin'), largest_group_with_admin)),
-        Italic(f'Took {stop_time:.02f}s'))
+            KeyValueItem(Bold('Admin in Channels'), summary['admin_in_broadcast_channels']),
+            KeyValueItem(Bold('Creator'), summary['creator_in_channels']),
+            KeyValueItem(Bold('Admin Rights'),
+                         summary['admin_in_broadcast_channels'] - summary['creator_in_channels'])),
+        KeyValueItem(Bold('Unread'), summary['unread']),
+        KeyValueItem(Bold('Unread Mentions'), summary['unread_mentions']),
+        KeyValueItem(Bold('Largest Group'), summary['largest_group_member_count']),
+        KeyValueItem(Bold('Largest Group with Admin'), summary['largest_group_with_admin'])),
+        Italic(f'Took {stop_time:.02f}s, last rescan {last_rescan:%Y-%m-%d %H:%M}'))
 
     await client.respond(event, response, reply=False)
-    await waiting_message.delete()
     tlog.info('Ran `stats` in `%s`. Response:\n %s', event.chat.title, response)
+
+
+@events.register(events.NewMessage())
+async def stats_new_message(event: NewMessage.Event) -> None:
+    """Count unread messages and new dialogs for the account stats."""
+    client: KantekClient = event.client
+    account_stats: AccountStats = client.account_stats
+    if not account_stats.last_rescan:
+        return
+    dialog = account_stats.dialogs.get(event.chat_id)
+    if dialog is None:
+        dialog = account_stats.add_dialog(event.chat_id, await event.get_chat())
+        if dialog is None:
+            return
+    if event.out:
+        # sending a message reads the chat
+        dialog.unread = 0
+    else:
+        dialog.unread += 1
+        if event.message.mentioned:
+            dialog.unread_mentions += 1
+    account_stats.mark_changed()
+
+
+@events.register(events.MessageRead(inbox=True))
+async def stats_message_read(event: MessageRead.Event) -> None:
+    """Reset the unread counters of a dialog for the account stats."""
+    client: KantekClient = event.client
+    account_stats: AccountStats = client.account_stats
+    dialog = account_stats.dialogs.get(event.chat_id)
+    if dialog is not None:
+        dialog.unread = 0
+        dialog.unread_mentions = 0
+        account_stats.mark_changed()
+
+
+@events.register(events.chataction.ChatAction())
+async def stats_chat_action(event: ChatAction.Event) -> None:
+    """Track joined and left chats and participant counts for the account stats."""
+    client: KantekClient = event.client
+    account_stats: AccountStats = client.account_stats
+    if not account_stats.last_rescan:
+        return
+    joined = event.user_joined or event.user_added
+    left = event.user_left or event.user_kicked
+    if not (joined or left):
+        return
+    if account_stats.me_id in event.user_ids:
+        if joined:
+            account_stats.add_dialog(event.chat_id, await event.get_chat())
+        else:
+            account_stats.remove_dialog(event.chat_id)
+        return
+    dialog = account_stats.dialogs.get(event.chat_id)
+    if dialog is not None and dialog.kind == 'supergroup':
+        change = len(event.user_ids)
+        dialog.participants += change if joined else -change
+        account_stats.mark_changed()
@@ -0,0 +1,282 @@
+"""Statistics of the user account that are kept up to date from updates."""
+import asyncio
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+
+import logzero
+from telethon.tl.custom import Dialog
+from telethon.tl.types import (Channel, Chat, ChatParticipantAdmin, ChatParticipantCreator,
+                               ChatParticipants, ChatParticipantsForbidden, User)
+
+if TYPE_CHECKING:
+    from utils.client import KantekClient
+
+logger: logging.Logger = logzero.logger
+
+PARTICIPANT_COUNT_CONCURRENCY = 10
+
+
+@dataclass
+class DialogStats:
+    """The counters of a single dialog.
+
+    Attributes:
+        kind: One of user, bot, group, supergroup or channel
+        admin: If the account is admin or creator
+        creator: If the account is the creator
+        participants: Participant count, only tracked for supergroups
+        unread: Unread messages
+        unread_mentions: Unread mentions
+    """
+    kind: str
+    admin: bool = False
+    creator: bool = False
+    participants: int = 0
+    unread: int = 0
+    unread_mentions: int = 0
+
+    @classmethod
+    def from_entity(cls, entity: Union[User, Chat, Channel]) -> 'DialogStats':
+        """Create the counters for a dialog entity."""
+        if isinstance(entity, User):
+            return cls('bot' if entity.bot else 'user')
+        if isinstance(entity, Channel):
+            kind = 'channel' if entity.broadcast else 'supergroup'
+        else:
+            kind = 'group'
+        return cls(kind, admin=bool(entity.creator or entity.admin_rights),
+                   creator=bool(entity.creator))
+
+
+class AccountStats:
+    """Running statistics of the account.
+
+    A full rescan fills the counters of every dialog. Afterwards they are updated
+    from events and written to `path` at most every `save_interval` seconds, so
+    `.stats` doesn't need to go through all dialogs again. The file is written in
+    the default executor and replaced atomically, so it is never left half written.
+
+    Attributes:
+        path: The json file the statistics are persisted in
+        dialogs: Counters by dialog id
+        me_id: The id of the account
+        last_rescan: Unix time of the last full rescan
+    """
+
+    def __init__(self, path: str, save_interval: float = 60) -> None:
+        self.path = path
+        self.save_interval = save_interval
+        self.dialogs: Dict[int, DialogStats] = {}
+        self.me_id: Optional[int] = None
+        self.last_rescan: float = 0
+        self._last_save: float = 0
+        self._dirty = False
+        self._save_lock: Optional[asyncio.Lock] = None
+        self._save_task: Optional[asyncio.Future] = None
+
+    def load(self) -> None:
+        """Load the persisted statistics if there are any."""
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.me_id = data.get('me_id')
+        self.last_rescan = data.get('last_rescan', 0)
+        self.dialogs = {int(k): DialogStats(**v) for k, v in data.get('dialogs', {}).items()}
+
+    async def save(self) -> None:
+        """Write the statistics to disk without blocking the event loop."""
+        # created lazily so it belongs to the running loop
+        if self._save_lock is None:
+            self._save_lock = asyncio.Lock()
+        async with self._save_lock:
+            # taken inside the lock so the last write always has the newest data
+            data = {'me_id': self.me_id,
+                    'last_rescan': self.last_rescan,
+                    'dialogs': {k: asdict(v) for k, v in self.dialogs.items()}}
+            self._last_save = time.time()
+            self._dirty = False
+            loop = asyncio.get_event_loop()
+            try:
+                await loop.run_in_executor(None, self._write, data)
+            except OSError:
+                self._dirty = True
+                raise
+
+    def maybe_save(self) -> None:
+        """Save the statistics in the background if they changed and weren't saved recently."""
+        if (self._dirty and self._save_task is None
+                and time.time() - self._last_save > self.save_interval):
+            self._save_task = asyncio.ensure_future(self._save_in_background())
+
+    def mark_changed(self) -> None:
+        """Flag the statistics as modified so they get persisted."""
+        self._dirty = True
+        self.maybe_save()
+
+    async def _save_in_background(self) -> None:
+        try:
+            await self.save()
+        except OSError as err:
+            logger.warning('Could not save the account stats: %s', err)
+        finally:
+            self._save_task = None
+
+    def _write(self, data: Dict[str, Any]) -> None:
+        """Replace the file with the data, blocking."""
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    async def rescan(self, client: 'KantekClient', fresh: bool = False) -> None:
+        """Rebuild all counters from the dialogs of the account.
+
+        Args:
+            client: The client
+            fresh: Ignore cached participant counts
+
+        Returns: None
+
+        """
+        self.me_id = (await client.get_me(input_peer=True)).user_id
+        dialogs: List[Dialog] = [dialog async for dialog in client.iter_dialogs()]
+        semaphore = asyncio.Semaphore(PARTICIPANT_COUNT_CONCURRENCY)
+
+        async def _count(dialog: Dialog) -> int:
+            async with semaphore:
+                return await client.get_participant_count(dialog.entity, fresh=fresh)
+
+        supergroups = [dialog for dialog in dialogs
+                       if isinstance(dialog.entity, Channel) and dialog.entity.megagroup]
+        counts = await asyncio.gather(*[_count(dialog) for dialog in supergroups])
+        participant_counts = {dialog.id: count for dialog, count in zip(supergroups, counts)}
+
+        self.dialogs = {}
+        for dialog in dialogs:
+            stats = DialogStats.from_entity(dialog.entity)
+            stats.participants = participant_counts.get(dialog.id, 0)
+            stats.unread = dialog.unread_count
+            stats.unread_mentions = dialog.unread_mentions_count
+            self.dialogs[dialog.id] = stats
+        self.last_rescan = time.time()
+        await self.save()
+
+    def summary(self) -> Dict[str, int]:
+        """Sum up the counters of all dialogs."""
+        summary = dict.fromkeys(['private_chats', 'bots', 'groups', 'broadcast_channels',
+                                 'admin_in_groups', 'creator_in_groups',
+                                 'admin_in_broadcast_channels', 'creator_in_channels',
+                                 'unread', 'unread_mentions', 'largest_group_member_count',
+                                 'largest_group_with_admin'], 0)
+        for stats in self.dialogs.values():
+            if stats.kind in ('user', 'bot'):
+                summary['private_chats'] += 1
+                if stats.kind == 'bot':
+                    summary['bots'] += 1
+            elif stats.kind == 'channel':
+                summary['broadcast_channels'] += 1
+                summary['admin_in_broadcast_channels'] += stats.admin
+                summary['creator_in_channels'] += stats.creator
+            else:
+                summary['groups'] += 1
+                summary['admin_in_groups'] += stats.admin
+                summary['creator_in_groups'] += stats.creator
+                summary['largest_group_member_count'] = max(
+                    summary['largest_group_member_count'], stats.participants)
+                if stats.admin:
+                    summary['largest_group_with_admin'] = max(
+                        summary['largest_group_with_admin'], stats.participants)
+            summary['unread'] += stats.unread
+            summary['unread_mentions'] += stats.unread_mentions
+        return summary
+
+    def add_dialog(self, dialog_id: int,
+                   entity: Optional[Union[User, Chat, Channel]]) -> Optional[DialogStats]:
+        """Start tracking a new dialog.
+
+        Args:
+            dialog_id: The id of the dialog
+            entity: The entity of the dialog, None if telethon couldn't get it
+
+        Returns: The counters of the dialog or None if the entity is unknown
+
+        """
+        if entity is None:
+            # the next rescan picks the dialog up
+            return None
+        stats = self.dialogs[dialog_id] = DialogStats.from_entity(entity)
+        self.mark_changed()
+        return stats
+
+    def update_rights(self, dialog_id: int, admin: bool, creator: Optional[bool] = None) -> None:
+        """Change the admin status of the account in a tracked dialog.
+
+        Args:
+            dialog_id: The id of the dialog
+            admin: If the account is admin or creator
+            creator: If the account is the creator, None keeps the current value
+
+        Returns: None
+
+        """
+        stats = self.dialogs.get(dialog_id)
+        if stats is None:
+            return
+        creator = stats.creator if creator is None else creator
+        admin = admin or creator
+        if (stats.admin, stats.creator) != (admin, creator):
+            stats.admin, stats.creator = admin, creator
+            self.mark_changed()
+
+    def update_entity(self, dialog_id: int, entity: Union[User, Chat, Channel]) -> None:
+        """Take the admin status of the account from a refetched dialog entity.
+
+        Args:
+            dialog_id: The id of the dialog
+            entity: The current entity of the dialog
+
+        Returns: None
+
+        """
+        fresh = DialogStats.from_entity(entity)
+        self.update_rights(dialog_id, fresh.admin, fresh.creator)
+
+    def update_participants(self, dialog_id: int,
+                            participants: Union[ChatParticipants,
+                                                ChatParticipantsForbidden]) -> None:
+        """Take the admin status of the account from the participant list of a group.
+
+        Args:
+            dialog_id: The id of the group
+            participants: The participants from an UpdateChatParticipants
+
+        Returns: None
+
+        """
+        if not isinstance(participants, ChatParticipants):
+            # the list is not visible to the account
+            return
+        for participant in participants.participants:
+            if participant.user_id == self.me_id:
+                creator = isinstance(participant, ChatParticipantCreator)
+                admin = creator or isinstance(participant, ChatParticipantAdmin)
+                self.update_rights(dialog_id, admin, creator)
+                return
+
+    def remove_dialog(self, dialog_id: int) -> None:
+        """Stop tracking a dialog.
+
+        Args:
+            dialog_id: The id of the dialog
+
+        Returns: None
+
+        """
+        if self.dialogs.pop(dialog_id, None) is not None:
+            self.mark_changed()
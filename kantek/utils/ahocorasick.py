@@ -0,0 +1,145 @@
+"""Aho-Corasick automaton to search a text for many strings in a single pass."""
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+
+class AhoCorasick:
+    """Multi pattern matcher for the string based blacklists.
+
+    Strings can be added and removed at any time. Adding a string only extends
+    the trie, the failure links are recomputed lazily on the next search.
+
+    >>> automaton = AhoCorasick()
+    >>> automaton.add('spam', '1')
+    >>> automaton.add('ham', '2')
+    >>> automaton.search('this is no spam')
+    '1'
+    >>> automaton.search('ha, ham')
+    '2'
+    >>> automaton.remove('spam')
+    True
+    >>> automaton.search('this is no spam') is None
+    True
+    """
+
+    def __init__(self) -> None:
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._values: List[Optional[str]] = [None]
+        # the closest node in the failure chain that ends a string, 0 if there is none
+        self._output: List[int] = [0]
+        self._size = 0
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, string: str, value: str) -> None:
+        """Add a string to the automaton.
+
+        Args:
+            string: The string to search for
+            value: The value that is returned when the string is found
+
+        Returns: None
+
+        """
+        if not string:
+            return
+        node = 0
+        for char in string:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][char] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._values.append(None)
+                self._output.append(0)
+            node = child
+        if self._values[node] is None:
+            self._size += 1
+        self._values[node] = value
+        self._dirty = True
+
+    def remove(self, string: str) -> bool:
+        """Remove a string from the automaton.
+
+        Args:
+            string: The string to remove
+
+        Returns: True if the string was in the automaton
+
+        """
+        node = 0
+        for char in string:
+            node = self._goto[node].get(char, -1)
+            if node == -1:
+                return False
+        if not string or self._values[node] is None:
+            return False
+        self._values[node] = None
+        self._size -= 1
+        self._dirty = True
+        return True
+
+    def search(self, text: str) -> Optional[str]:
+        """Scan the text once and return the value of the first string found.
+
+        Args:
+            text: The text to search
+
+        Returns: The value of the matching string or None
+
+        """
+        if self._dirty:
+            self.build()
+        goto = self._goto
+        fail = self._fail
+        output = self._output
+        node = 0
+        for char in text:
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            if output[node]:
+                return self._values[output[node]]
+        return None
+
+    def copy(self) -> 'AhoCorasick':
+        """Return an independent copy that can be changed without affecting this automaton.
+
+        Returns: The copied automaton
+
+        """
+        automaton = AhoCorasick()
+        automaton._goto = [dict(edges) for edges in self._goto]
+        automaton._fail = list(self._fail)
+        automaton._values = list(self._values)
+        automaton._output = list(self._output)
+        automaton._size = self._size
+        automaton._dirty = self._dirty
+        return automaton
+
+    def build(self) -> None:
+        """Compute the failure and output links with a breadth first traversal.
+
+        search does this when strings changed, call it before sharing the automaton
+        between threads.
+        """
+        queue: Deque[int] = deque(self._goto[0].values())
+        for child in queue:
+            self._fail[child] = 0
+        while queue:
+            node = queue.popleft()
+            if self._values[node] is not None:
+                self._output[node] = node
+            else:
+                self._output[node] = self._output[self._fail[node]]
+            for char, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(char, 0)
+                queue.append(child)
+        self._dirty = False
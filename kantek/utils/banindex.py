@@ -0,0 +1,125 @@
+"""Compact in memory set of banned user ids."""
+import heapq
+from array import array
+from bisect import bisect_left
+from typing import Any, Iterable, Optional, Set
+
+
+class BanIndex:
+    """Set of banned ids that stays small for millions of entries.
+
+    The ids are stored in a sorted array of 64 bit integers, which needs 8 bytes
+    per id instead of the ~70 bytes of a python set, and are looked up with a
+    binary search. Changes are collected in two small sets that are merged into
+    the array once they grow larger than `merge_threshold`.
+
+    >>> index = BanIndex()
+    >>> index.load([3, 1, 2])
+    >>> 2 in index, '3' in index, 4 in index
+    (True, True, False)
+    >>> index.add(4)
+    >>> index.remove('1')
+    >>> 4 in index, 1 in index, len(index)
+    (True, False, 3)
+    >>> None in index
+    False
+    """
+
+    def __init__(self, merge_threshold: int = 10000) -> None:
+        self.merge_threshold = merge_threshold
+        self._ids = array('q')
+        self._added: Set[int] = set()
+        self._removed: Set[int] = set()
+
+    def __contains__(self, uid: Any) -> bool:
+        _id = self._to_int(uid)
+        if _id is None:
+            return False
+        if _id in self._added:
+            return True
+        if _id in self._removed:
+            return False
+        return self._in_array(_id)
+
+    def __len__(self) -> int:
+        return len(self._ids) + len(self._added) - len(self._removed)
+
+    def load(self, uids: Iterable[Any]) -> None:
+        """Replace the content of the index.
+
+        Args:
+            uids: All banned ids
+
+        Returns: None
+
+        """
+        ids = (self._to_int(uid) for uid in uids)
+        self._ids = array('q', sorted(_id for _id in ids if _id is not None))
+        self._added.clear()
+        self._removed.clear()
+
+    def add(self, uid: Any) -> None:
+        """Add a banned id.
+
+        Args:
+            uid: The user id
+
+        Returns: None
+
+        """
+        _id = self._to_int(uid)
+        if _id is None:
+            return
+        self._removed.discard(_id)
+        if not self._in_array(_id):
+            self._added.add(_id)
+            self._maybe_merge()
+
+    def update(self, uids: Iterable[Any]) -> None:
+        """Add multiple banned ids.
+
+        Args:
+            uids: The user ids
+
+        Returns: None
+
+        """
+        for uid in uids:
+            self.add(uid)
+
+    def remove(self, uid: Any) -> None:
+        """Remove a id from the index.
+
+        Args:
+            uid: The user id
+
+        Returns: None
+
+        """
+        _id = self._to_int(uid)
+        if _id is None:
+            return
+        self._added.discard(_id)
+        if self._in_array(_id):
+            self._removed.add(_id)
+            self._maybe_merge()
+
+    def _in_array(self, _id: int) -> bool:
+        pos = bisect_left(self._ids, _id)
+        return pos < len(self._ids) and self._ids[pos] == _id
+
+    def _maybe_merge(self) -> None:
+        if len(self._added) + len(self._removed) < self.merge_threshold:
+            return
+        removed = self._removed
+        merged = heapq.merge(self._ids, sorted(self._added))
+        self._ids = array('q', (_id for _id in merged if _id not in removed))
+        self._added = set()
+        self._removed = set()
+
+    @staticmethod
+    def _to_int(uid: Any) -> Optional[int]:
+        try:
+            return int(uid)
+        except (TypeError, ValueError):
+            return None
@@ -0,0 +1,190 @@
+"""Engine to remove deleted accounts from chats concurrently."""
+import asyncio
+import datetime
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+import logzero
+from telethon.errors import FloodWaitError, RPCError, UserAdminInvalidError
+from telethon.tl.functions.channels import EditBannedRequest
+from telethon.tl.types import Channel, ChatBannedRights, User
+
+from utils.ratelimit import AdaptiveRateLimiter
+
+if TYPE_CHECKING:
+    from utils.client import KantekClient
+
+logger: logging.Logger = logzero.logger
+tlog = logging.getLogger('kantek-channel-log')
+
+BANNED_RIGHTS = ChatBannedRights(until_date=datetime.datetime(2038, 1, 1), view_messages=True)
+
+
+@dataclass
+class CleanupStats:
+    """Counters of a cleanup run.
+
+    Attributes:
+        participants: Amount of participants of the chats
+        scanned: Amount of participants checked so far
+        deleted_accounts: Deleted accounts found
+        banned: Deleted accounts that were removed
+        deleted_admins: Deleted accounts that could not be removed because they are admins
+        failed: Deleted accounts that could not be removed because of another error
+        started: Time the cleanup started at
+    """
+    participants: int = 0
+    scanned: int = 0
+    deleted_accounts: int = 0
+    banned: int = 0
+    deleted_admins: int = 0
+    failed: int = 0
+    started: float = field(default_factory=time.monotonic)
+
+    @property
+    def rate(self) -> float:
+        """Removed accounts per second."""
+        elapsed = time.monotonic() - self.started
+        return self.banned / elapsed if elapsed else 0
+
+
+class CleanupEngine:
+    """Remove deleted accounts from one or more chats.
+
+    Each chat is scanned once to gather the deleted accounts, then they are banned by
+    `concurrency` workers. All requests go through one AdaptiveRateLimiter, so a
+    FloodWait pauses every worker at once and lowers the rate for the rest of the run.
+
+    Attributes:
+        client: The client used for the requests
+        concurrency: Amount of ban requests running at the same time per chat
+        limiter: The rate limiter shared by all workers
+        stats: Counters over all chats
+        chats: Counters per chat id
+        chats_total: Amount of chats in a network cleanup
+        chats_done: Amount of chats of a network cleanup that finished
+        failed_chats: Chat ids that could not be cleaned up and the error
+    """
+
+    def __init__(self, client: 'KantekClient', concurrency: int = 5,
+                 limiter: Optional[AdaptiveRateLimiter] = None) -> None:
+        self.client = client
+        self.concurrency = concurrency
+        self.limiter = limiter or AdaptiveRateLimiter(rate=5, max_rate=20)
+        self.stats = CleanupStats()
+        self.chats: Dict[int, CleanupStats] = {}
+        self.chats_total = 0
+        self.chats_done = 0
+        self.failed_chats: Dict[int, str] = {}
+
+    async def run(self, chat: Channel, count_only: bool = False) -> CleanupStats:
+        """Clean up a single chat.
+
+        Args:
+            chat: The chat
+            count_only: Only count the deleted accounts
+
+        Returns: The counters of this chat
+
+        """
+        chat_id = await self.client.get_peer_id(chat)
+        stats = self.chats[chat_id] = CleanupStats()
+        deleted_users = await self._collect(chat, stats)
+        if not count_only and deleted_users:
+            queue: asyncio.Queue = asyncio.Queue()
+            for user in deleted_users:
+                queue.put_nowait(user)
+            workers = min(self.concurrency, len(deleted_users))
+            await asyncio.gather(*[self._ban_worker(chat, queue, stats) for _ in range(workers)])
+        return stats
+
+    async def run_network(self, chats: List[Channel], count_only: bool = False,
+                          parallel_chats: int = 5) -> None:
+        """Clean up multiple chats in parallel.
+
+        All chats share the rate limiter of the engine. Chats without ban rights
+        are only counted.
+
+        Args:
+            chats: The chats
+            count_only: Only count the deleted accounts
+            parallel_chats: Amount of chats that are processed at the same time
+
+        Returns: None
+
+        """
+        self.chats_total = len(chats)
+        semaphore = asyncio.Semaphore(parallel_chats)
+
+        async def _run(chat: Channel) -> None:
+            async with semaphore:
+                can_ban = chat.creator or chat.admin_rights
+                try:
+                    await self.run(chat, count_only=count_only or not can_ban)
+                except RPCError as error:
+                    logger.error('Cleanup of %s failed: %s', chat.id, error)
+                    self.failed_chats[chat.id] = type(error).__name__
+                finally:
+                    self.chats_done += 1
+
+        await asyncio.gather(*[_run(chat) for chat in chats])
+
+    async def _collect(self, chat: Channel, stats: CleanupStats) -> List[User]:
+        """Gather the deleted accounts of a chat, the scan starts over after a FloodWait."""
+        while True:
+            await self.limiter.acquire()
+            try:
+                return await self._scan(chat, stats)
+            except FloodWaitError as error:
+                self._flood_wait(error)
+                # drop the counts of the interrupted scan
+                self.stats.participants -= stats.participants
+                self.stats.scanned -= stats.scanned
+                self.stats.deleted_accounts -= stats.deleted_accounts
+                stats.participants = stats.scanned = stats.deleted_accounts = 0
+
+    async def _scan(self, chat: Channel, stats: CleanupStats) -> List[User]:
+        participant_count = await self.client.get_participant_count(chat)
+        stats.participants = participant_count
+        self.stats.participants += participant_count
+        deleted_users = []
+        user: User
+        async for user in self.client.iter_participants(chat):
+            stats.scanned += 1
+            self.stats.scanned += 1
+            if user.deleted:
+                deleted_users.append(user)
+                stats.deleted_accounts += 1
+                self.stats.deleted_accounts += 1
+        return deleted_users
+
+    async def _ban_worker(self, chat: Channel, queue: asyncio.Queue,
+                          stats: CleanupStats) -> None:
+        while not queue.empty():
+            user: User = queue.get_nowait()
+            while True:
+                await self.limiter.acquire()
+                try:
+                    await self.client(EditBannedRequest(chat, user, BANNED_RIGHTS))
+                    self.limiter.success()
+                    stats.banned += 1
+                    self.stats.banned += 1
+                except UserAdminInvalidError:
+                    stats.deleted_admins += 1
+                    self.stats.deleted_admins += 1
+                except FloodWaitError as error:
+                    self._flood_wait(error)
+                    continue
+                except RPCError as error:
+                    # one user that can't be removed doesn't stop the cleanup
+                    logger.error('Could not remove %s from %s: %s', user.id, chat.id, error)
+                    stats.failed += 1
+                    self.stats.failed += 1
+                break
+
+    def _flood_wait(self, error: FloodWaitError) -> None:
+        tlog.error(error)
+        logger.warning('Cleanup got FloodWait for %ss', error.seconds)
+        self.limiter.flood_wait(error.seconds)
@@ -1,13 +1,22 @@
 """File containing the Custom TelegramClient"""
-import time
-from typing import Optional, Union
+import asyncio
+from typing import Any, Dict, FrozenSet, Optional, Union
 
-from telethon import TelegramClient
-from telethon.events import NewMessage
+from telethon import TelegramClient, events, utils
+from telethon.errors import RPCError
+from telethon.events import ChatAction, NewMessage
+from telethon.tl.functions.users import GetFullUserRequest
 from telethon.tl.patched import Message
-
-import config
-from database.arango import ArangoDB
+from telethon.tl.tlobject import TLObject
+from telethon.tl.types import (Channel, ChannelParticipantsAdmins, Chat, PeerChannel, PeerChat,
+                               InputUser, UpdateChannel, UpdateChatParticipantAdmin,
+                               UpdateChatParticipants, UserFull)
+
+from database.backend import StorageBackend
+from utils.accountstats import AccountStats
+from utils.cache import TTLCache
+from utils.gbanqueue import BanRequest, GbanWorker
+from utils import perf
 from utils.mdtex import FormattedBase, MDTeXDocument, Section
 from utils.pluginmgr import PluginManager
 
@@ -15,8 +24,24 @@ from utils.pluginmgr import PluginManager
 class KantekClient(TelegramClient):  # pylint: disable = R0901, W0223
     """Custom telethon client that has the plugin manager as attribute."""
     plugin_mgr: Optional[PluginManager] = None
-    db: Optional[ArangoDB] = None
+    db: Optional[StorageBackend] = None
     kantek_version: str = ''
+    account_stats: Optional[AccountStats] = None
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.admin_cache = TTLCache(maxsize=2000, ttl=600)
+        self.gban_worker = GbanWorker(self)
+        self.participant_counts = TTLCache(maxsize=5000, ttl=3600)
+        self.full_users = TTLCache(maxsize=5000, ttl=600)
+        self._full_user_requests: Dict[int, asyncio.Future] = {}
+        self.add_event_handler(self._on_chat_action, events.ChatAction())
+        self.add_event_handler(self._on_raw_update, events.Raw())
+
+    async def __call__(self, request: TLObject, ordered: bool = False) -> Any:
+        """Send a request and record the time spent waiting for Telegram."""
+        with perf.span('rpc'):
+            return await super().__call__(request, ordered=ordered)
 
     async def respond(self, event: NewMessage.Event,
                       msg: Union[str, FormattedBase, Section, MDTeXDocument],
@@ -37,9 +62,142 @@ class KantekClient(TelegramClient):  # pylint: disable = R0901, W0223
         else:
             return await event.respond(msg, reply_to=event.message.id)
 
-    async def gban(self, uid: Union[int, str], reason: str, fedban: bool = True):
+    async def get_admin_ids(self, chat_id: int) -> FrozenSet[int]:
+        """Return the ids of all admins in a chat.
+
+        The list is cached per chat until it expires or a participant update
+        invalidates it.
+
+        Args:
+            chat_id: The id of the chat
+
+        Returns: A set with the user ids of the admins
+
+        """
+        admins = self.admin_cache.get(chat_id)
+        if admins is None:
+            participants = await self.get_participants(chat_id, filter=ChannelParticipantsAdmins())
+            admins = frozenset(p.id for p in participants)
+            self.admin_cache.set(chat_id, admins)
+        return admins
+
+    async def is_admin(self, chat_id: int, user_id: int) -> bool:
+        """Check if a user is admin in a chat using the cached admin list
+
+        Args:
+            chat_id: The id of the chat
+            user_id: The id of the user
+
+        Returns: True if the user is an admin
+
+        """
+        return user_id in await self.get_admin_ids(chat_id)
+
+    def invalidate_admins(self, chat_id: int) -> None:
+        """Drop the cached admin list of a chat.
+
+        Args:
+            chat_id: The id of the chat
+
+        Returns: None
+
+        """
+        self.admin_cache.pop(chat_id)
+
+    async def _on_chat_action(self, event: ChatAction.Event) -> None:
+        """Invalidate the admin list of a chat if a cached admin left or was kicked."""
+        if event.user_left or event.user_kicked:
+            admins = self.admin_cache.get(event.chat_id)
+            if admins is not None and event.user_id in admins:
+                self.invalidate_admins(event.chat_id)
+
+    async def _on_raw_update(self, update: TLObject) -> None:
+        """Invalidate the admin list of a chat if its participants or admin rights changed.
+
+        The admin status of the account in the account stats is updated as well.
+        """
+        stats = self.account_stats
+        if stats is not None and (not stats.last_rescan or stats.me_id is None):
+            stats = None
+        if isinstance(update, UpdateChatParticipantAdmin):
+            chat_id = utils.get_peer_id(PeerChat(update.chat_id))
+            self.invalidate_admins(chat_id)
+            if stats is not None and update.user_id == stats.me_id:
+                stats.update_rights(chat_id, update.is_admin)
+        elif isinstance(update, UpdateChatParticipants):
+            chat_id = utils.get_peer_id(PeerChat(update.participants.chat_id))
+            self.invalidate_admins(chat_id)
+            if stats is not None:
+                stats.update_participants(chat_id, update.participants)
+        elif isinstance(update, UpdateChannel):
+            chat_id = utils.get_peer_id(PeerChannel(update.channel_id))
+            self.invalidate_admins(chat_id)
+            if stats is not None and chat_id in stats.dialogs:
+                # the update doesn't say what changed, the entity has the current rights
+                try:
+                    entity = await self.get_entity(PeerChannel(update.channel_id))
+                except (ValueError, RPCError):
+                    return
+                stats.update_entity(chat_id, entity)
+
+    async def get_participant_count(self, chat: Union[int, Channel, Chat],
+                                    fresh: bool = False) -> int:
+        """Return the amount of participants in a chat.
+
+        The count is cached per chat for `participant_counts.ttl` seconds.
+
+        Args:
+            chat: The chat
+            fresh: Ignore the cached count
+
+        Returns: The participant count
+
+        """
+        chat_id = await self.get_peer_id(chat)
+        count = None if fresh else self.participant_counts.get(chat_id)
+        if count is None:
+            count = (await self.get_participants(chat, limit=0)).total
+            self.participant_counts.set(chat_id, count)
+        return count
+
+    async def get_full_user(self, user: Union[int, InputUser], fresh: bool = False) -> UserFull:
+        """Return the full info of a user.
+
+        The result is cached per user for `full_users.ttl` seconds. Concurrent calls
+        for the same user share a single request, so a user joining many chats at
+        once is only fetched once.
+
+        Args:
+            user: The user id or input user
+            fresh: Ignore the cached info
+
+        Returns: The full user
+
+        """
+        user_id = utils.get_peer_id(user)
+        if not fresh:
+            full_user = self.full_users.get(user_id)
+            if full_user is not None:
+                return full_user
+            pending = self._full_user_requests.get(user_id)
+            if pending is not None:
+                return await asyncio.shield(pending)
+        request = asyncio.ensure_future(self(GetFullUserRequest(user)))
+        self._full_user_requests[user_id] = request
+        try:
+            # shield the request so a cancelled caller doesn't cancel it for the others
+            full_user = await asyncio.shield(request)
+        finally:
+            if self._full_user_requests.get(user_id) is request:
+                del self._full_user_requests[user_id]
+        self.full_users.set(user_id, full_user)
+        return full_user
+
+    async def gban(self, uid: Union[int, str], reason: str, fedban: bool = True) -> None:
         """Command to gban a user
 
+        The ban is queued and sent by the gban worker in the background.
+
         Args:
             uid: User ID
             reason: Ban reason
@@ -48,30 +206,15 @@ class KantekClient(TelegramClient):  # pylint: disable = R0901, W0223
         Returns: None
 
         """
-        await self.send_message(
-            config.gban_group,
-            f'<a href="tg://user?id={uid}">{uid}</a>', parse_mode='html')
-        await self.send_message(
-            config.gban_group,
-            f'/ban {uid} {reason}')
-        if fedban:
-            await self.send_message(
-                config.gban_group,
-                f'/fban {uid} {reason}')
-        time.sleep(0.5)
-        await self.send_read_acknowledge(config.gban_group,
-                                         max_id=1000000,
-                                         clear_mentions=True)
-        data = {'_key': str(uid),
-                'id': str(uid),
-                'reason': reason}
-        self.db.query('UPSERT {"_key": @ban.id} '
-                      'INSERT @ban '
-                      'UPDATE {"reason": @ban.reason} '
-                      'IN BanList', bind_vars={'ban': data})
-
-    async def ungban(self, uid: Union[int, str], fedban: bool = True):
-        """Command to gban a user
+        if self.db is not None:
+            # known spammers are banned on sight before the worker stored the ban
+            self.db.banlist.index.add(uid)
+        self.gban_worker.submit(BanRequest(str(uid), reason, fedban))
+
+    async def ungban(self, uid: Union[int, str], fedban: bool = True) -> None:
+        """Command to ungban a user
+
+        The unban is queued and sent by the gban worker in the background.
 
         Args:
             uid: User ID
@@ -80,20 +223,6 @@ class KantekClient(TelegramClient):  # pylint: disable = R0901, W0223
         Returns: None
 
         """
-        await self.send_message(
-            config.gban_group,
-            f'<a href="tg://user?id={uid}">{uid}</a>', parse_mode='html')
-        await self.send_message(
-            config.gban_group,
-            f'/unban {uid}')
-        if fedban:
-            await self.send_message(
-                config.gban_group,
-                f'/unfban {uid}')
-        time.sleep(0.5)
-        await self.send_read_acknowledge(config.gban_group,
-                                         max_id=1000000,
-                                         clear_mentions=True)
-
-        self.db.query('REMOVE {"_key": @uid} '
-                      'IN BanList', bind_vars={'uid': str(uid)})
+        if self.db is not None:
+            self.db.banlist.index.remove(uid)
+        self.gban_worker.submit(BanRequest(str(uid), None, fedban))
@@ -0,0 +1,131 @@
+"""Route commands to plugin callbacks from a single event handler."""
+import logging
+import re
+from typing import Callable, Dict, List, Optional
+
+import logzero
+from telethon import TelegramClient, events
+from telethon.events import NewMessage
+
+logger: logging.Logger = logzero.logger
+
+_LITERAL = re.compile(r'[\w-]+')
+_OPTIONAL_GROUP = re.compile(r'\(([\w-]+)\)\?')
+
+
+def expand_pattern(pattern: str) -> Optional[List[str]]:
+    """Expand a command pattern into all command names it matches.
+
+    Only literal characters and optional groups like `(lugins)?` are supported.
+
+    >>> expand_pattern('p(lugins)?')
+    ['p', 'plugins']
+    >>> expand_pattern('a(uto)?b(ahn)?')
+    ['ab', 'abahn', 'autob', 'autobahn']
+    >>> expand_pattern('ban.*') is None
+    True
+
+    Args:
+        pattern: The regex after the command prefix
+
+    Returns: The command names or None if the pattern can't be expanded
+
+    """
+    commands = ['']
+    pos = 0
+    while pos < len(pattern):
+        literal = _LITERAL.match(pattern, pos)
+        if literal:
+            commands = [command + literal.group() for command in commands]
+            pos = literal.end()
+            continue
+        group = _OPTIONAL_GROUP.match(pattern, pos)
+        if group:
+            commands = [command + suffix for command in commands for suffix in ('', group[1])]
+            pos = group.end()
+            continue
+        return None
+    return sorted(commands) if pattern else None
+
+
+class CommandDispatcher:
+    """Look up the command of a message in a dict instead of matching every pattern.
+
+    Telethon tries the pattern of every handler on every message and the patterns
+    overlap, `.u(ser)?` for example also matches `.ungban`. The dispatcher is a single
+    NewMessage handler that extracts the command after the prefix once and only calls
+    the callbacks registered for exactly that command. The event builders of the
+    callbacks are still checked, so `outgoing`, `chats` and `pattern_match` behave
+    the same as for a normal handler.
+
+    Attributes:
+        client: The client the dispatcher is registered with
+        commands: Callbacks by command name
+    """
+
+    def __init__(self, client: TelegramClient, prefix: str) -> None:
+        self.client = client
+        self.commands: Dict[str, List[Callable]] = {}
+        self._prefix = re.compile(f'(?:{prefix})(\\S+)')
+        self._registered = False
+
+    @staticmethod
+    def can_route(callback: Callable) -> bool:
+        """Check if all event builders of a callback can be handled by the dispatcher."""
+        builders = events.list(callback)
+        return bool(builders) and all(type(builder) is NewMessage for builder in builders)
+
+    def add(self, callback: Callable, commands: List[str]) -> None:
+        """Route commands to a callback.
+
+        Args:
+            callback: The plugin callback
+            commands: The command names without prefix
+
+        Returns: None
+
+        """
+        for command in commands:
+            self.commands.setdefault(command, []).append(callback)
+        if not self._registered:
+            self.client.add_event_handler(self._dispatch, NewMessage())
+            self._registered = True
+
+    def remove(self, callback: Callable) -> bool:
+        """Stop routing commands to a callback.
+
+        Args:
+            callback: The plugin callback
+
+        Returns: True if the callback was routed by the dispatcher
+
+        """
+        found = False
+        for command, callbacks in list(self.commands.items()):
+            if callback in callbacks:
+                callbacks.remove(callback)
+                found = True
+                if not callbacks:
+                    del self.commands[command]
+        return found
+
+    async def _dispatch(self, event: NewMessage.Event) -> None:
+        match = self._prefix.match(event.message.message or '')
+        if not match:
+            return
+        callbacks = self.commands.get(match.group(1))
+        if not callbacks:
+            return
+        for callback in callbacks[:]:
+            for builder in events.list(callback):
+                if not builder.resolved:
+                    await builder.resolve(self.client)
+                if not builder.filter(event):
+                    continue
+                try:
+                    await callback(event)
+                except events.StopPropagation:
+                    raise
+                except Exception:  # pylint: disable = W0703
+                    logger.exception('Unhandled exception on %s', callback.__name__)
+                break
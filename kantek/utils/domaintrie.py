@@ -0,0 +1,135 @@
+"""Trie over reversed domain labels to match a host and all of its parent domains."""
+from typing import Any, Dict, List, Optional
+
+# key of the value of a domain ending at a node, labels never contain a dot
+_END = '.'
+
+
+class DomainTrie:
+    """Index for the domain blacklist that also matches subdomains.
+
+    Domains are stored by their labels in reverse order, `a.evil.com` becomes
+    `com -> evil -> a`, so a lookup walks the labels of the host once and finds the
+    blacklisted domain closest to the top level.
+
+    >>> trie = DomainTrie()
+    >>> trie.add('evil.com', '1')
+    >>> trie.search('a.b.Evil.com:443')
+    '1'
+    >>> trie.search('evil.com.')
+    '1'
+    >>> trie.search('notevil.com') is None
+    True
+    >>> trie.remove('evil.com')
+    True
+    >>> trie.search('a.evil.com') is None
+    True
+    """
+
+    def __init__(self) -> None:
+        self._root: Dict[str, Any] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def add(self, domain: str, value: str) -> None:
+        """Add a domain to the trie.
+
+        Args:
+            domain: The blacklisted domain
+            value: The value that is returned when the domain or a subdomain is found
+
+        Returns: None
+
+        """
+        labels = self._labels(domain)
+        if not labels:
+            return
+        node = self._root
+        for label in labels:
+            node = node.setdefault(label, {})
+        if _END not in node:
+            self._size += 1
+        node[_END] = value
+
+    def remove(self, domain: str) -> bool:
+        """Remove a domain from the trie.
+
+        Args:
+            domain: The blacklisted domain
+
+        Returns: True if the domain was in the trie
+
+        """
+        labels = self._labels(domain)
+        path = [self._root]
+        for label in labels:
+            node = path[-1].get(label)
+            if node is None:
+                return False
+            path.append(node)
+        if not labels or _END not in path[-1]:
+            return False
+        del path[-1][_END]
+        self._size -= 1
+        # drop the nodes that no longer lead to a domain
+        for label, parent, node in zip(reversed(labels), reversed(path[:-1]), reversed(path)):
+            if node:
+                break
+            del parent[label]
+        return True
+
+    def search(self, host: str) -> Optional[str]:
+        """Find the blacklisted domain the host is part of.
+
+        Args:
+            host: A host name or netloc, ports and credentials are ignored
+
+        Returns: The value of the matching domain or None
+
+        """
+        node = self._root
+        for label in self._labels(host):
+            child: Optional[Dict[str, Any]] = node.get(label)
+            if child is None:
+                return None
+            node = child
+            if _END in node:
+                value: str = node[_END]
+                return value
+        return None
+
+    def build(self) -> None:
+        """Finish pending work before the trie is shared, the trie has none.
+
+        Returns: None
+
+        """
+
+    def copy(self) -> 'DomainTrie':
+        """Return an independent copy that can be changed without affecting this trie.
+
+        Returns: The copied trie
+
+        """
+        trie = DomainTrie()
+        trie._size = self._size
+        stack = [(self._root, trie._root)]
+        while stack:
+            source, target = stack.pop()
+            for label, child in source.items():
+                if label == _END:
+                    target[label] = child
+                else:
+                    target[label] = {}
+                    stack.append((child, target[label]))
+        return trie
+
+    @staticmethod
+    def _labels(domain: str) -> List[str]:
+        host = domain.rpartition('@')[2]
+        name, _, port = host.rpartition(':')
+        if name and port.isdigit():
+            host = name
+        return [label for label in reversed(host.lower().strip('.').split('.')) if label]
@@ -0,0 +1,128 @@
+"""Background worker that sends global bans to the gban group."""
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Optional, Union
+
+import logzero
+from telethon import TelegramClient
+
+import config
+from utils.ratelimit import TokenBucket
+
+logger: logging.Logger = logzero.logger
+
+
+@dataclass
+class BanRequest:
+    """A queued gban or ungban.
+
+    Attributes:
+        uid: User ID
+        reason: Ban reason, None for an ungban
+        fedban: If /fban or /unfban should be used
+        queued: Time the request was queued at
+    """
+    uid: str
+    reason: Optional[str]
+    fedban: bool
+    queued: float = field(default_factory=time.monotonic)
+
+
+class GbanWorker:
+    """Process gbans from a queue so the calling handler can return immediately.
+
+    Messages to each target chat are rate limited with a token bucket. The read
+    acknowledge for the gban group is only sent once the queue is drained.
+
+    Attributes:
+        client: The client used to send the messages
+        rate: Messages per second per target chat
+        burst: Messages that can be sent at once before the rate limit applies
+        processed: Amount of successfully processed requests
+        failed: Amount of requests that raised an error
+    """
+
+    def __init__(self, client: TelegramClient, rate: float = 1, burst: int = 5) -> None:
+        self.client = client
+        self.rate = rate
+        self.burst = burst
+        self.processed = 0
+        self.failed = 0
+        self._latencies: Deque[float] = deque(maxlen=100)
+        self._buckets: Dict[Union[str, int], TokenBucket] = {}
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Future] = None
+
+    @property
+    def queue_depth(self) -> int:
+        """Amount of requests waiting to be processed."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    @property
+    def latency(self) -> float:
+        """Average seconds between queueing and finishing the last 100 requests."""
+        if not self._latencies:
+            return 0
+        return sum(self._latencies) / len(self._latencies)
+
+    def submit(self, request: BanRequest) -> None:
+        """Queue a request and start the worker if it isn't running.
+
+        Args:
+            request: The gban or ungban
+
+        Returns: None
+
+        """
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if self._task is None or self._task.done():
+            self._task = asyncio.ensure_future(self._run(self._queue))
+        self._queue.put_nowait(request)
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        while True:
+            request: BanRequest = await queue.get()
+            try:
+                await self._process(request)
+            except Exception as err:  # pylint: disable = W0703
+                self.failed += 1
+                logger.exception(err)
+            else:
+                self.processed += 1
+            self._latencies.append(time.monotonic() - request.queued)
+            if queue.empty():
+                await self._acknowledge(queue)
+
+    async def _process(self, request: BanRequest) -> None:
+        uid = request.uid
+        await self._send(config.gban_group,
+                         f'<a href="tg://user?id={uid}">{uid}</a>', parse_mode='html')
+        if request.reason is not None:
+            await self._send(config.gban_group, f'/ban {uid} {request.reason}')
+            if request.fedban:
+                await self._send(config.gban_group, f'/fban {uid} {request.reason}')
+            await self.client.db.aio.upsert_bans([{'id': uid, 'reason': request.reason}])
+        else:
+            await self._send(config.gban_group, f'/unban {uid}')
+            if request.fedban:
+                await self._send(config.gban_group, f'/unfban {uid}')
+            await self.client.db.aio.remove_bans([uid])
+
+    async def _send(self, chat: Union[str, int], text: str, **kwargs: Any) -> None:
+        bucket = self._buckets.get(chat)
+        if bucket is None:
+            bucket = self._buckets[chat] = TokenBucket(self.rate, self.burst)
+        await bucket.acquire()
+        await self.client.send_message(chat, text, **kwargs)
+
+    async def _acknowledge(self, queue: asyncio.Queue) -> None:
+        # give the bots in the gban group time to respond before marking everything as read
+        await asyncio.sleep(0.5)
+        if queue.empty():
+            await self.client.send_read_acknowledge(config.gban_group,
+                                                    max_id=1000000,
+                                                    clear_mentions=True)
@@ -1,18 +1,17 @@
 """Helper functions to aid with different tasks that dont require a client."""
 import csv
 import re
-import urllib
-from typing import Dict, List, Tuple
+from typing import Dict, Iterator, List, Optional, Tuple
 
-import requests
-from requests import ConnectionError
 from telethon import utils
 from telethon.events import NewMessage
 from telethon.tl.types import User
 
 from utils import parsers
+from utils.resolver import URLResolver
 
 INVITELINK_PATTERN = re.compile(r'(?:joinchat|join)(?:/|\?invite=)(.*|)')
+URL_RESOLVER = URLResolver()
 
 
 async def get_full_name(user: User) -> str:
@@ -49,26 +48,38 @@ async def rose_csv_to_dict(filename: str) -> List[Dict[str, str]]:
     Returns:
 
     """
-    bans = []
-    with open(filename, encoding='utf-8', newline='') as f:  #
+    return list(iter_rose_csv(filename))
+
+
+def iter_rose_csv(filename: str) -> Iterator[Dict[str, str]]:
+    """Lazily parse a fedban list from Rose, one ban at a time
+
+    This is blocking and should be consumed in a thread.
+
+    Args:
+        filename: The name of the csv
+
+    Returns: A generator of documents that can be imported into ArangoDB
+
+    """
+    with open(filename, encoding='utf-8', newline='') as f:
         csv_file = csv.reader(f, delimiter=',')
         # skip the header
         next(csv_file, None)
         for line in csv_file:
             _id = line[0]
             reason = line[-1]
-            bans.append({'_key': _id, 'id': _id, 'reason': reason})
-    return bans
+            yield {'_key': _id, 'id': _id, 'reason': reason}
 
 
-async def resolve_invite_link(link):
+async def resolve_invite_link(link: str) -> Tuple[Optional[int], Optional[int], Optional[int]]:
     """Method to work around a bug in telethon 1.6 and 1.7 that makes the resolve_invite_link method
     unable to parse tg://invite style links
 
     This is temporary and will be removed
 
     Args:
-        link:
+        link: The invite link
 
     Returns:
         Same as telethons method
@@ -76,9 +87,10 @@ async def resolve_invite_link(link):
     """
     encoded_link = re.search(INVITELINK_PATTERN, link)
     if encoded_link is not None:
-        encoded_link = encoded_link.group(1)
-        invite_link = f't.me/joinchat/{encoded_link}'
-        return utils.resolve_invite_link(invite_link)
+        invite_link = f't.me/joinchat/{encoded_link.group(1)}'
+        resolved: Tuple[Optional[int], Optional[int], Optional[int]]
+        resolved = utils.resolve_invite_link(invite_link)
+        return resolved
     else:
         return None, None, None
 
@@ -86,20 +98,12 @@ async def resolve_invite_link(link):
 async def resolve_url(url: str) -> str:
     """Follow all redirects and return the base domain
 
+    The lookup is done by the shared URLResolver which caches the results.
+
     Args:
         url: The url
 
     Returns:
         The base comain as given by urllib.parse
     """
-    if not url.startswith('http'):
-        url = f'http://{url}'
-    try:
-        req = requests.get(url)
-        url = req.url
-    except ConnectionError:
-        pass
-    netloc = urllib.parse.urlparse(url).netloc
-    if netloc:
-        url = netloc
-    return url
+    return await URL_RESOLVER.resolve(url)
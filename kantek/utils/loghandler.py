@@ -1,20 +1,42 @@
 """Module with the Custom Logging Handler for logging to a Telegram Channel."""
+import queue
+import threading
+import time
 from datetime import datetime
 from logging import Handler, LogRecord, Logger
-from typing import Union, Dict
+from typing import Dict, List, Optional, Union
 
 import logzero
+import requests
 
 from vendor import lazybot
 
 logger: Logger = logzero.logger
 
+MAX_MESSAGE_LENGTH = 4096
+# seconds flush waits for the queued records to be sent
+FLUSH_TIMEOUT = 10
+# seconds to wait for the Bot API to answer a request
+REQUEST_TIMEOUT = 10
+# times a message is sent again after the Bot API asked to retry later
+MAX_RETRIES = 5
+
 
 class TGChannelLogHandler(Handler):
-    """Log to a Telegram Channel using a Bot"""
+    """Log to a Telegram Channel using a Bot
+
+    Records are queued and sent by a background thread so logging never waits for
+    the Bot API. Records that arrive within `flush_interval` seconds are joined into
+    one message. If the queue is full or a message can't be sent the records are
+    dropped and a summary of the dropped records is appended to the next message.
+    flush and close wait until the queued records are sent.
+    """
 
-    def __init__(self, bot_token: str, channel_id: Union[str, int]) -> None:
+    def __init__(self, bot_token: str, channel_id: Union[str, int],
+                 queue_size: int = 500, flush_interval: float = 2) -> None:
         self.bot = lazybot.Bot(bot_token)
+        # reuse the connection for all log messages
+        self.session = requests.Session()
         self.me: Dict[str, Union[bool, str, int]] = self.bot.get_me()
         if not self.me['ok']:
             logger.warning('Got Error: %s %s '
@@ -23,7 +45,15 @@ class TGChannelLogHandler(Handler):
                            self.me.get("error_code"), self.me.get("description"))
 
         self.channel_id = channel_id
+        self.flush_interval = flush_interval
+        self.queue: 'queue.Queue[str]' = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        # guards dropped, which emit and the worker thread both change
+        self._dropped_lock = threading.Lock()
         super(TGChannelLogHandler, self).__init__()
+        self._worker = threading.Thread(target=self._process_queue,
+                                        name='tg-channel-log', daemon=True)
+        self._worker.start()
 
     def format(self, record: LogRecord) -> str:
         """Format the specified record."""
@@ -37,16 +67,107 @@ class TGChannelLogHandler(Handler):
             'origin': origin,
             'level': f'`{record.levelname.title()}({record.levelno})`',
             'time': f'`{log_time}`',
-            'msg': record.getMessage()
         }
         log_entry = []
         for k, v in _log_entry.items():
             log_entry.append(f'`{k}:` {v}')
-        return '\n'.join(log_entry)
+        header = '\n'.join(log_entry) + '\n`msg:` '
+        # shorten the message itself, cutting the formatted text could leave markdown open
+        return header + record.getMessage()[:MAX_MESSAGE_LENGTH - len(header)]
 
     def emit(self, record: LogRecord) -> None:
-        """Send the log message to the specified Telegram channel."""
-        self.bot.send_message(
-            chat_id=self.channel_id,
-            text=self.format(record),
-            parse_mode='markdown')
+        """Queue the log message to be sent to the specified Telegram channel."""
+        try:
+            self.queue.put_nowait(self.format(record))
+        except queue.Full:
+            self._drop(1)
+
+    def flush(self) -> None:
+        """Wait until all queued records are sent, at most FLUSH_TIMEOUT seconds."""
+        deadline = time.monotonic() + FLUSH_TIMEOUT
+        with self.queue.all_tasks_done:
+            while self.queue.unfinished_tasks:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self.queue.all_tasks_done.wait(timeout)
+
+    def close(self) -> None:
+        """Send the queued records before the handler is closed."""
+        self.flush()
+        super().close()
+
+    def _process_queue(self) -> None:
+        """Collect queued records into messages and send them."""
+        pending: Optional[str] = None
+        while True:
+            entries: List[str] = [pending if pending is not None else self.queue.get()]
+            pending = None
+            length = len(entries[0])
+            deadline = time.monotonic() + self.flush_interval
+            while True:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    entry = self.queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if length + len(entry) + 2 > MAX_MESSAGE_LENGTH:
+                    pending = entry
+                    break
+                entries.append(entry)
+                length += len(entry) + 2
+            self._send(entries)
+            for _ in entries:
+                self.queue.task_done()
+
+    def _send(self, entries: List[str]) -> None:
+        with self._dropped_lock:
+            dropped, self.dropped = self.dropped, 0
+        # records that are reported again as dropped if the message can't be sent
+        records = len(entries)
+        if dropped:
+            summary = f'`{dropped} log records were dropped.`'
+            if sum(len(e) + 2 for e in entries) + len(summary) <= MAX_MESSAGE_LENGTH:
+                entries = entries + [summary]
+                records += dropped
+            elif not self._post(summary):
+                self._drop(dropped)
+        if not self._post('\n\n'.join(entries)):
+            self._drop(records)
+
+    def _drop(self, records: int) -> None:
+        """Count records as dropped so the next message reports them."""
+        with self._dropped_lock:
+            self.dropped += records
+
+    def _post(self, text: str) -> bool:
+        """Send a message to the channel, retry at most MAX_RETRIES times if rate limited.
+
+        Args:
+            text: The text of the message
+
+        Returns: True if the message was sent
+
+        """
+        retries = 0
+        while True:
+            try:
+                response = self.session.post(f'{self.bot.url}/sendMessage',
+                                             data={'chat_id': self.channel_id,
+                                                   'text': text,
+                                                   'parse_mode': 'markdown'},
+                                             timeout=REQUEST_TIMEOUT).json()
+            except (requests.RequestException, ValueError) as err:
+                logger.warning('Could not send log message: %s', err)
+                return False
+            if response.get('error_code') == 429 and retries < MAX_RETRIES:
+                retries += 1
+                time.sleep(response.get('parameters', {}).get('retry_after', 1))
+                continue
+            if not response.get('ok'):
+                logger.warning('Got Error: %s %s from the bot API while logging.',
+                               response.get('error_code'), response.get('description'))
+                return False
+            return True
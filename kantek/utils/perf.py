@@ -0,0 +1,234 @@
+"""Latency histograms for plugin callbacks and the work they wait on."""
+import asyncio
+import contextvars
+import functools
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Tuple
+
+import logzero
+from telethon.events import StopPropagation
+
+logger: logging.Logger = logzero.logger
+
+BUCKETS: Tuple[float, ...] = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                              0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+_current_handler: contextvars.ContextVar = contextvars.ContextVar('perf_handler', default=None)
+
+
+class Histogram:
+    """Fixed bucket latency histogram like the ones Prometheus uses.
+
+    >>> histogram = Histogram()
+    >>> for value in (0.002, 0.003, 0.2):
+    ...     histogram.observe(value)
+    >>> histogram.count, histogram.quantile(0.5)
+    (3, 0.005)
+    """
+
+    def __init__(self, buckets: Tuple[float, ...] = BUCKETS) -> None:
+        self.buckets = buckets
+        # the last count is for values above the largest bucket
+        self.counts: List[int] = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum: float = 0
+
+    def observe(self, value: float) -> None:
+        """Record a value in seconds."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Return the upper bound of the bucket the quantile falls into."""
+        if not self.count:
+            return 0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    @property
+    def mean(self) -> float:
+        """Average of the recorded values."""
+        return self.sum / self.count if self.count else 0
+
+
+class HandlerStats:
+    """Counters of a single plugin callback.
+
+    Attributes:
+        calls: Amount of calls
+        errors: Amount of calls that raised an exception
+        latency: Histogram of the total run time
+        spans: Histograms of the time spent waiting for the database, Telegram
+            and url resolution by kind
+    """
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.errors = 0
+        self.latency = Histogram()
+        self.spans: Dict[str, Histogram] = {}
+
+
+class PerfRegistry:
+    """Collect the timings of all plugin callbacks.
+
+    Callbacks are wrapped by `instrument`. Spans that are opened while a callback
+    runs, also in tasks it starts, are recorded for that callback, other spans
+    under `background`.
+
+    Attributes:
+        handlers: Statistics by callback name
+        started: Time the collection started at
+    """
+
+    def __init__(self) -> None:
+        self.handlers: Dict[str, HandlerStats] = {}
+        self.started = time.time()
+
+    def get(self, name: str) -> HandlerStats:
+        """Return the statistics of a callback, creating them if necessary."""
+        stats = self.handlers.get(name)
+        if stats is None:
+            stats = self.handlers[name] = HandlerStats()
+        return stats
+
+    def instrument(self, name: str, callback: Callable) -> Callable:
+        """Wrap a callback to record its calls, errors and latency.
+
+        The wrapper keeps the attributes of the callback, including the event
+        builders telethon stores on it.
+
+        Args:
+            name: The name the statistics are recorded under
+            callback: The coroutine function
+
+        Returns: The wrapped coroutine function
+
+        """
+        @functools.wraps(callback)
+        async def wrapper(*args: Any, **kwargs: Any) -> Any:
+            stats = self.get(name)
+            stats.calls += 1
+            token = _current_handler.set(name)
+            start_time = time.perf_counter()
+            try:
+                return await callback(*args, **kwargs)
+            except StopPropagation:
+                raise
+            except Exception:
+                stats.errors += 1
+                raise
+            finally:
+                stats.latency.observe(time.perf_counter() - start_time)
+                _current_handler.reset(token)
+
+        return wrapper
+
+    @contextmanager
+    def span(self, kind: str) -> Iterator[None]:
+        """Record the time spent in the block for the current callback.
+
+        Args:
+            kind: What is waited for, for example db, rpc or url
+
+        """
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            stats = self.get(_current_handler.get() or 'background')
+            histogram = stats.spans.get(kind)
+            if histogram is None:
+                histogram = stats.spans[kind] = Histogram()
+            histogram.observe(time.perf_counter() - start_time)
+
+    def reset(self) -> None:
+        """Drop all collected statistics."""
+        self.handlers.clear()
+        self.started = time.time()
+
+    def prometheus_text(self) -> str:
+        """Format the statistics in the Prometheus text exposition format."""
+        lines = ['# TYPE kantek_handler_calls_total counter',
+                 '# TYPE kantek_handler_errors_total counter',
+                 '# TYPE kantek_handler_latency_seconds histogram',
+                 '# TYPE kantek_span_latency_seconds histogram']
+        for name, stats in sorted(self.handlers.items()):
+            labels = f'handler="{name}"'
+            # background only has spans
+            if stats.calls:
+                lines.append(f'kantek_handler_calls_total{{{labels}}} {stats.calls}')
+                lines.append(f'kantek_handler_errors_total{{{labels}}} {stats.errors}')
+                lines += self._histogram_lines('kantek_handler_latency_seconds',
+                                               labels, stats.latency)
+            for kind, histogram in sorted(stats.spans.items()):
+                lines += self._histogram_lines('kantek_span_latency_seconds',
+                                               f'{labels},kind="{kind}"', histogram)
+        return '\n'.join(lines) + '\n'
+
+    def write_prometheus(self, path: str) -> None:
+        """Write the statistics to a file that is replaced atomically.
+
+        Args:
+            path: The file the scraper reads
+
+        Returns: None
+
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(self.prometheus_text())
+        os.replace(tmp_path, path)
+
+    async def export_periodically(self, path: str, interval: float = 15) -> None:
+        """Write the Prometheus file every `interval` seconds.
+
+        Args:
+            path: The file the scraper reads
+            interval: Seconds between writes
+
+        Returns: None
+
+        """
+        while True:
+            try:
+                self.write_prometheus(path)
+            except OSError as err:
+                logger.warning('Could not write the metrics file: %s', err)
+            await asyncio.sleep(interval)
+
+    @staticmethod
+    def _histogram_lines(metric: str, labels: str, histogram: Histogram) -> List[str]:
+        lines = []
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{metric}_sum{{{labels}}} {histogram.sum}')
+        lines.append(f'{metric}_count{{{labels}}} {histogram.count}')
+        return lines
+
+
+REGISTRY = PerfRegistry()
+
+
+def instrument(name: str, callback: Callable) -> Callable:
+    """Wrap a callback with the global registry, see PerfRegistry.instrument."""
+    return REGISTRY.instrument(name, callback)
+
+
+def span(kind: str) -> ContextManager[None]:
+    """Time a block with the global registry, see PerfRegistry.span."""
+    return REGISTRY.span(kind)
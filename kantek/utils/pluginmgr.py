@@ -1,20 +1,30 @@
 """Contains the Plugin Manager handling loading and unloading of plugins."""
 import ast
+import asyncio
+import hashlib
+import json
 import os
-from dataclasses import dataclass
+import time
+from dataclasses import dataclass, field
 import importlib.util
 from importlib._bootstrap import ModuleSpec
-from importlib._bootstrap_external import SourceFileLoader
 from logging import Logger
-from typing import Callable, Dict, List, Tuple
+from types import ModuleType
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 import logzero
 from telethon import TelegramClient
 
+from config import cmd_prefix
+from utils import perf
+from utils.dispatcher import CommandDispatcher, expand_pattern
+
 logger: Logger = logzero.logger
 
 __version__ = '0.1.0'
 
+MANIFEST_FORMAT = 2
+
 
 @dataclass
 class Callback:
@@ -24,10 +34,12 @@ class Callback:
         name: Callback name
         callback: The callback function
         private: If the callback is private or not
+        commands: Command names routed by the dispatcher, None for a normal handler
     """
     name: str
     callback: Callable
     private: bool
+    commands: Optional[List[str]] = None
 
 
 @dataclass
@@ -41,12 +53,19 @@ class Plugin:
         plugin_path: Plugin folder the plugin lies in
         path: Plugin Path relative to the Plugin Folder
         version: The plugin version
+        timings: Seconds spent on parsing, importing and registering the plugin
     """
     name: str
     callbacks: List[Callback]
     full_path: str
     plugin_path: str
     version: str
+    timings: Dict[str, float] = field(default_factory=dict)
+
+    @property
+    def load_time(self) -> float:
+        """Total seconds it took to load the plugin."""
+        return sum(self.timings.values())
 
     @property
     def path(self) -> str:
@@ -58,12 +77,21 @@ class Plugin:
 
 
 class PluginManager:
-    """Mange loading and unloading of plugins."""
+    """Mange loading and unloading of plugins.
+
+    The metadata extracted from the plugin source (callbacks, privacy flags and
+    version) is cached in a manifest so unchanged plugins are not parsed again.
+    Commands with a simple pattern are routed by a CommandDispatcher instead of
+    registering their own handler.
+    """
     active_plugins: List[Plugin] = []
 
     def __init__(self, client: TelegramClient) -> None:
         self.client = client
         self.plugin_path: str = os.path.abspath('./plugins')
+        self.dispatcher = CommandDispatcher(client, cmd_prefix)
+        self.manifest_path: str = os.path.abspath('./tmp/plugin_manifest.json')
+        self._manifest: Dict[str, Dict[str, Any]] = self._load_manifest()
 
     def register_all(self) -> List[Plugin]:
         """Get a list of all plugins and register them with the client.
@@ -71,24 +99,125 @@ class PluginManager:
         Returns: List of active plugins
 
         """
-        for plugin_name, path in self._get_plugin_list():
-            plugin_version = self._get_plugin_version(path)
-            active_commands = []
-            for callback in self._get_plugin_callbacks(plugin_name, path):
-                logger.debug('Registered plugin %s/%s',
-                             self._get_plugin_location(path), callback.name)
-                active_commands.append(callback)
-                self.client.add_event_handler(callback.callback)
-            self.active_plugins.append(
-                Plugin(plugin_name,
-                       active_commands,
-                       path,
-                       self.plugin_path,
-                       plugin_version))
-
-        logger.info('Registered %s plugins.', len(self.active_plugins))
+        start_time = time.time()
+        plugin_list = self._get_plugin_list()
+        for plugin_name, path in plugin_list:
+            self.register_plugin(plugin_name, path)
+        # forget plugins that were deleted or renamed
+        seen = {path for _, path in plugin_list}
+        self._manifest = {path: entry for path, entry in self._manifest.items() if path in seen}
+        self._save_manifest()
+
+        logger.info('Registered %s plugins in %.02fs.',
+                    len(self.active_plugins), time.time() - start_time)
+        for plugin in sorted(self.active_plugins, key=lambda p: p.load_time, reverse=True):
+            logger.debug('%s took %.01fms (%s)', plugin.path, plugin.load_time * 1000,
+                         ', '.join(f'{step}: {seconds * 1000:.01f}ms'
+                                   for step, seconds in plugin.timings.items()))
         return self.active_plugins
 
+    def register_plugin(self, name: str, path: str) -> Plugin:
+        """Import a plugin and register its callbacks with the client.
+
+        Args:
+            name: The plugin name without path
+            path: Absolute path to the plugin
+
+        Returns: The registered plugin
+
+        """
+        plugin = self._load_plugin(name, path)
+        start_time = time.time()
+        for callback in plugin.callbacks:
+            logger.debug('Registered plugin %s/%s',
+                         self._get_plugin_location(path), callback.name)
+            self._add_callback(callback)
+        plugin.timings['register'] = time.time() - start_time
+        self.active_plugins.append(plugin)
+        return plugin
+
+    def reload_plugin(self, path: str) -> Optional[Plugin]:
+        """Import a plugin again and swap its event handlers.
+
+        The new module is imported before anything is changed, so a plugin that fails
+        to import stays active in its old version. Removing the old and adding the new
+        handlers happens without giving control back to the event loop, so no update
+        is handled by both or neither version. Handlers that are already running finish
+        with the old code.
+
+        Args:
+            path: Absolute path or path relative to the plugin folder, with or without .py
+
+        Returns: The reloaded plugin or None if the file was deleted
+
+        """
+        full_path = self._get_full_path(path)
+        old_plugin = self.get_plugin(full_path)
+        if not os.path.exists(full_path):
+            if old_plugin is not None:
+                self.unregister_plugin(old_plugin)
+            if self._manifest.pop(full_path, None) is not None:
+                self._save_manifest()
+            return None
+        name = os.path.splitext(os.path.basename(full_path))[0]
+        plugin = self._load_plugin(name, full_path)
+
+        if old_plugin is not None:
+            for callback in old_plugin.callbacks:
+                self._remove_callback(callback)
+        for callback in plugin.callbacks:
+            self._add_callback(callback)
+
+        if old_plugin is not None:
+            self.active_plugins[self.active_plugins.index(old_plugin)] = plugin
+        else:
+            self.active_plugins.append(plugin)
+        self._save_manifest()
+        logger.info('Reloaded plugin %s [%s]', plugin.path, plugin.version)
+        return plugin
+
+    def get_plugin(self, path: str) -> Optional[Plugin]:
+        """Return the active plugin for a path.
+
+        Args:
+            path: Absolute path or path relative to the plugin folder, with or without .py
+
+        Returns: The plugin or None if it isn't active
+
+        """
+        full_path = self._get_full_path(path)
+        for plugin in self.active_plugins:
+            if plugin.full_path == full_path:
+                return plugin
+        return None
+
+    async def watch(self, interval: float = 2) -> None:
+        """Reload plugins when their file changes.
+
+        New files are registered, deleted files unregistered. Plugins that were
+        unregistered by hand are not registered again.
+
+        Args:
+            interval: Seconds between checks for changes
+
+        Returns: None
+
+        """
+        mtimes = self._get_plugin_mtimes()
+        while True:
+            await asyncio.sleep(interval)
+            current = self._get_plugin_mtimes()
+            for path in set(mtimes) | set(current):
+                if mtimes.get(path) == current.get(path):
+                    continue
+                if path in mtimes and self.get_plugin(path) is None:
+                    continue
+                try:
+                    self.reload_plugin(path)
+                except Exception as err:  # pylint: disable = W0703
+                    logger.exception('Could not reload %s: %s', path, err)
+            mtimes = current
+
     def unregister_all(self, builtins: bool = False) -> None:
         """Unregister all plugins
 
@@ -97,7 +226,7 @@ class PluginManager:
 
         Returns: None
         """
-        for plugin in self.active_plugins:
+        for plugin in self.active_plugins[:]:
             if builtins:
                 self.unregister_plugin(plugin)
             else:
@@ -114,7 +243,7 @@ class PluginManager:
 
         """
         for callback in plugin.callbacks:
-            logger.debug(self.client.remove_event_handler(callback.callback))
+            logger.debug(self._remove_callback(callback))
         self.active_plugins.remove(plugin)
 
     def _get_plugin_location(self, path: str) -> str:
@@ -133,30 +262,118 @@ class PluginManager:
                     plugins.append((name, path))
         return plugins
 
-    def _get_plugin_callbacks(self, name: str, path: str) -> List[Callback]:
-        _module: ModuleSpec = importlib.util.spec_from_file_location(name, path)
-        loader: SourceFileLoader = _module.loader
-        module = loader.load_module()
+    def _load_plugin(self, name: str, path: str) -> Plugin:
+        """Parse and import a plugin without registering it."""
+        timings = {}
+        start_time = time.time()
+        metadata = self._get_plugin_metadata(path)
+        timings['parse'] = time.time() - start_time
+
+        start_time = time.time()
+        module = self._import_plugin(name, path)
+        timings['import'] = time.time() - start_time
+
+        location = self._get_plugin_location(path)
+        callbacks = [Callback(callback_name,
+                              perf.instrument(f'{location}/{callback_name}',
+                                              getattr(module, callback_name)),
+                              is_private, commands)
+                     for callback_name, is_private, commands in metadata['callbacks']]
+        return Plugin(name,
+                      callbacks,
+                      path,
+                      self.plugin_path,
+                      metadata['version'],
+                      timings)
+
+    def _add_callback(self, callback: Callback) -> None:
+        if callback.commands and self.dispatcher.can_route(callback.callback):
+            self.dispatcher.add(callback.callback, callback.commands)
+        else:
+            self.client.add_event_handler(callback.callback)
+
+    def _remove_callback(self, callback: Callback) -> int:
+        """Remove a callback from the dispatcher or the client and return the removed count."""
+        if self.dispatcher.remove(callback.callback):
+            return 1
+        return self.client.remove_event_handler(callback.callback)
+
+    def _get_full_path(self, path: str) -> str:
+        if not path.endswith('.py'):
+            path += '.py'
+        return os.path.abspath(os.path.join(self.plugin_path, path))
+
+    def _get_plugin_mtimes(self) -> Dict[str, float]:
+        mtimes = {}
+        for _, path in self._get_plugin_list():
+            try:
+                mtimes[path] = os.stat(path).st_mtime
+            except OSError:
+                pass
+        return mtimes
+
+    def _get_plugin_metadata(self, path: str) -> Dict[str, Any]:
+        """Return the callbacks and version of a plugin.
+
+        The result is taken from the manifest if the file didn't change since it was
+        last parsed. The modification time is checked first and the file hash only
+        if it differs.
+        """
+        stat = os.stat(path)
+        entry: Optional[Dict[str, Any]] = self._manifest.get(path)
+        if entry is not None and entry.get('format') != MANIFEST_FORMAT:
+            entry = None
+        if entry is not None and entry['mtime'] == stat.st_mtime and entry['size'] == stat.st_size:
+            return entry
+        with open(path, 'rb') as f:
+            source = f.read()
+        file_hash = hashlib.sha1(source).hexdigest()
+        if entry is None or entry['hash'] != file_hash:
+            entry = self._parse_plugin(source.decode('utf-8'))
+            entry['hash'] = file_hash
+            entry['format'] = MANIFEST_FORMAT
+        entry['mtime'] = stat.st_mtime
+        entry['size'] = stat.st_size
+        self._manifest[path] = entry
+        return entry
+
+    @classmethod
+    def _parse_plugin(cls, source: str) -> Dict[str, Any]:
+        """Extract callbacks, their privacy flag, commands and the version from the source."""
+        version = ''
         callbacks = []
-        with open(path, encoding='utf-8') as f:
-            tree = ast.parse(f.read())
-            for item in tree.body:
-                if isinstance(item, ast.AsyncFunctionDef) and not item.name.startswith('_'):
-                    is_private = self.__is_private(self.__get_event_decorator_keywords(item))
-                    callbacks.append(Callback(item.name, getattr(module, item.name), is_private))
-        return callbacks
+        tree = ast.parse(source)
+        for item in tree.body:
+            if isinstance(item, ast.AsyncFunctionDef) and not item.name.startswith('_'):
+                is_private = cls.__is_private(cls.__get_event_decorator_keywords(item))
+                callbacks.append((item.name, is_private, cls.__get_commands(item)))
+            elif isinstance(item, ast.Assign):
+                target = item.targets[0]
+                if isinstance(target, ast.Name) and target.id == '__version__':
+                    version = item.value.s
+        return {'version': version, 'callbacks': callbacks}
 
     @staticmethod
-    def _get_plugin_version(path: str) -> str:
-        version = ''
-        with open(path, encoding='utf-8') as f:
-            tree = ast.parse(f.read())
-            for item in tree.body:
-                if isinstance(item, ast.Assign):
-                    target = item.targets[0]
-                    if target.id == '__version__':
-                        version = item.value.s
-        return version
+    def _import_plugin(name: str, path: str) -> ModuleType:
+        _module: ModuleSpec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(_module)
+        _module.loader.exec_module(module)
+        return module
+
+    def _load_manifest(self) -> Dict[str, Dict[str, Any]]:
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_manifest(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(self.manifest_path), exist_ok=True)
+            with open(self.manifest_path, 'w', encoding='utf-8') as f:
+                json.dump(self._manifest, f)
+        except OSError as err:
+            logger.warning('Could not write the plugin manifest: %s', err)
 
     @staticmethod
     def __is_private(keywords: Dict[str, bool]) -> bool:
@@ -177,6 +394,30 @@ class PluginManager:
                 keywords.update(cls.__get_keywords(decorator))
         return keywords
 
+    @staticmethod
+    def __get_commands(func: ast.AsyncFunctionDef) -> Optional[List[str]]:
+        """Expand the pattern of a single NewMessage decorator with the command prefix."""
+        if len(func.decorator_list) != 1:
+            return None
+        decorator = func.decorator_list[0]
+        if (not isinstance(decorator, ast.Call) or len(decorator.args) != 1
+                or not isinstance(decorator.args[0], ast.Call)):
+            return None
+        builder: ast.Call = decorator.args[0]
+        if not (isinstance(builder.func, ast.Attribute) and builder.func.attr == 'NewMessage'):
+            return None
+        for keyword in builder.keywords:
+            if keyword.arg != 'pattern':
+                continue
+            pattern = keyword.value
+            if (isinstance(pattern, ast.JoinedStr) and len(pattern.values) == 2
+                    and isinstance(pattern.values[0], ast.FormattedValue)
+                    and isinstance(pattern.values[0].value, ast.Name)
+                    and pattern.values[0].value.id == 'cmd_prefix'
+                    and isinstance(pattern.values[1], ast.Str)):
+                return expand_pattern(pattern.values[1].s)
+        return None
+
     @staticmethod
     def __get_keywords(decorator: ast.Call) -> Dict[str, bool]:
         keywords = {}
@@ -0,0 +1,105 @@
+"""Rate limiting primitives for outgoing requests."""
+import asyncio
+import time
+
+
+class TokenBucket:
+    """Asynchronous token bucket.
+
+    Tokens are refilled continuously with `rate` tokens per second up to `capacity`.
+    Acquiring a token waits without blocking the event loop until one is available.
+
+    Attributes:
+        rate: Tokens added per second
+        capacity: Maximum amount of tokens that can be saved up for bursts
+    """
+
+    def __init__(self, rate: float, capacity: float) -> None:
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    async def acquire(self, tokens: float = 1) -> None:
+        """Wait until the requested amount of tokens is available and take them.
+
+        Args:
+            tokens: The amount of tokens
+
+        Returns: None
+
+        """
+        while True:
+            self._refill()
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return
+            await asyncio.sleep((tokens - self.tokens) / self.rate)
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class AdaptiveRateLimiter:
+    """Rate limiter that learns from FloodWait errors.
+
+    A FloodWait pauses everyone using the limiter until it is over and halves the
+    request rate. Every successful request raises the rate again by `increase`
+    until `max_rate` is reached.
+
+    Attributes:
+        min_rate: The rate is never lowered below this
+        max_rate: The rate is never raised above this
+        increase: Requests per second added after each successful request
+        flood_waits: Amount of FloodWaits reported
+        longest_wait: Longest FloodWait reported in seconds
+    """
+
+    def __init__(self, rate: float, max_rate: float, min_rate: float = 0.2,
+                 increase: float = 0.05) -> None:
+        self.bucket = TokenBucket(rate, max(1, rate))
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.flood_waits = 0
+        self.longest_wait = 0
+        self._resume_at = 0.0
+
+    @property
+    def rate(self) -> float:
+        """The current requests per second."""
+        return self.bucket.rate
+
+    @property
+    def paused_for(self) -> float:
+        """Seconds until the current FloodWait is over."""
+        return max(0.0, self._resume_at - time.monotonic())
+
+    async def acquire(self) -> None:
+        """Wait until a FloodWait is over and a request may be made."""
+        while self.paused_for:
+            await asyncio.sleep(self.paused_for)
+        await self.bucket.acquire()
+
+    def success(self) -> None:
+        """Report a successful request."""
+        self.bucket.rate = min(self.max_rate, self.bucket.rate + self.increase)
+
+    def flood_wait(self, seconds: float) -> None:
+        """Report a FloodWait error.
+
+        Args:
+            seconds: The seconds telegram asked to wait
+
+        Returns: None
+
+        """
+        self.flood_waits += 1
+        self.longest_wait = max(self.longest_wait, seconds)
+        self._resume_at = max(self._resume_at, time.monotonic() + seconds)
+        self.bucket.rate = max(self.min_rate, self.bucket.rate / 2)
+        # start refilling only once the wait is over so there is no burst afterwards
+        self.bucket.tokens = 0
+        self.bucket.updated = self._resume_at
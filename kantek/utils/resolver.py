@@ -0,0 +1,83 @@
+"""Asynchronous url resolver used for the domain blacklist."""
+import asyncio
+import urllib.parse
+from typing import Optional
+
+import aiohttp
+
+from utils import perf
+from utils.cache import TTLCache
+
+
+class URLResolver:
+    """Follow the redirects of an url without blocking the event loop.
+
+    All requests share one connection pool. Resolved domains are cached, failed
+    lookups are cached too so a dead host is only contacted once per `failure_ttl`.
+
+    Attributes:
+        max_redirects: How many redirects are followed before giving up
+        timeout: Total timeout for a request in seconds
+        concurrency: Maximum amount of simultaneous requests
+        ttl: Seconds a resolved domain is cached
+        failure_ttl: Seconds a failed lookup is cached
+    """
+
+    def __init__(self, max_redirects: int = 5, timeout: float = 5, concurrency: int = 20,
+                 cache_size: int = 10000, ttl: float = 3600, failure_ttl: float = 300) -> None:
+        self.max_redirects = max_redirects
+        self.timeout = timeout
+        self.concurrency = concurrency
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self.cache = TTLCache(cache_size, ttl)
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+
+    async def resolve(self, url: str) -> str:
+        """Follow all redirects and return the base domain
+
+        Args:
+            url: The url
+
+        Returns:
+            The base domain as given by urllib.parse
+        """
+        if not url.startswith('http'):
+            url = f'http://{url}'
+        domain: Optional[str] = self.cache.get(url)
+        if domain is not None:
+            return domain
+        try:
+            with perf.span('url'):
+                domain = self._netloc(await self._follow(url))
+            ttl = self.ttl
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            domain = self._netloc(url)
+            ttl = self.failure_ttl
+        self.cache.set(url, domain, ttl)
+        return domain
+
+    async def close(self) -> None:
+        """Close the underlying http session."""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _follow(self, url: str) -> str:
+        session = self._session
+        if session is None or session.closed:
+            # both belong to the running loop, so they are created on first use
+            session = self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.concurrency),
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        semaphore = self._semaphore
+        assert semaphore is not None, 'the semaphore is created with the session'
+        async with semaphore:
+            async with session.get(url, max_redirects=self.max_redirects) as response:
+                return str(response.url)
+
+    @staticmethod
+    def _netloc(url: str) -> str:
+        return urllib.parse.urlparse(url).netloc or url